@@ -2,19 +2,42 @@ import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 import json
 import os
-import hashlib
 import datetime
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from decimal import Decimal, ROUND_HALF_UP
+
+from security import hash_password, check_password
 
 
 class BankSystem:
+    # Transaction history rows loaded per page in the account details window
+    HISTORY_PAGE_SIZE = 50
+
     def __init__(self):
         # Data storage file
         self.DATA_FILE = 'bank_data.json'
         self.current_user = None
         self.user_role = None
+        self.user_tree = None
+        self.account_tree = None
+        self.owner_combobox = None
 
         # Load data or create default if file doesn't exist
         self.load_data()
+        self.written_history_file = None
+
+        # Snapshots are written by a background thread so the UI never waits on disk
+        self.pending_save = None
+        self.saving = False
+        self.save_condition = threading.Condition()
+        self.save_thread = threading.Thread(target=self.save_worker, daemon=True)
+        self.save_thread.start()
+
+        # Passwords are verified off the UI thread; the hash is deliberately slow
+        self.auth_executor = ThreadPoolExecutor(max_workers=1)
 
         # Initialize the main window
         self.root = tk.Tk()
@@ -42,12 +65,13 @@ class BankSystem:
             default_data = {
                 'users': {
                     'admin': {
-                        'password': hashlib.sha256('admin123'.encode()).hexdigest(),
+                        'password': hash_password('admin123'),
                         'role': 'admin',
                         'name': 'System Administrator'
                     }
                 },
-                'accounts': {}
+                'accounts': {},
+                'meta': {'amount_unit': 'cents'}
             }
             with open(self.DATA_FILE, 'w') as f:
                 json.dump(default_data, f, indent=4)
@@ -57,15 +81,150 @@ class BankSystem:
             with open(self.DATA_FILE, 'r') as f:
                 self.data = json.load(f)
 
+        # Split snapshots keep each account's history in a separate file at
+        # [offset, length]; histories are only read when an account is opened,
+        # so startup doesn't depend on how many transactions there are
+        meta = self.data.setdefault('meta', {})
+        self.loaded_history_file = meta.get('history_file')
+        self.history_path = None
+        if self.loaded_history_file:
+            self.history_path = os.path.join(os.path.dirname(self.DATA_FILE), self.loaded_history_file)
+            size = os.path.getsize(self.history_path)
+            if meta.get('history_size') is not None and size != meta['history_size']:
+                raise ValueError(f"History file {self.history_path} is torn: "
+                                 f"{size} bytes instead of {meta['history_size']}")
+
+        # Convert files written with float amounts to integer cents
+        if meta.get('amount_unit') != 'cents':
+            for account in self.data['accounts'].values():
+                account['balance'] = self.to_cents(account['balance'])
+                for transaction in self.account_transactions(account):
+                    transaction['amount'] = self.to_cents(transaction['amount'])
+            meta['amount_unit'] = 'cents'
+
+        # Seed the account ID counter for files written before it existed
+        if 'next_account_number' not in meta:
+            meta['next_account_number'] = max(
+                (int(account_id[3:]) for account_id in self.data['accounts']), default=0) + 1
+
+        # Index account IDs by owner so dashboards don't scan every account
+        self.owner_index = {}
+        for account_id, account in self.data['accounts'].items():
+            self.owner_index.setdefault(account['owner'], []).append(account_id)
+
+    def account_transactions(self, account):
+        # Read an account's history from the history file on first use
+        if 'transactions' not in account:
+            offset, length = account.pop('history')
+            with open(self.history_path, 'rb') as f:
+                f.seek(offset)
+                account['transactions'] = json.loads(f.read(length))
+        return account['transactions']
+
+    @staticmethod
+    def to_cents(amount):
+        # Balances and amounts are stored as integer cents
+        return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+    @staticmethod
+    def format_money(cents):
+        sign = '-' if cents < 0 else ''
+        return f"{sign}${abs(cents) // 100}.{abs(cents) % 100:02d}"
+
     def save_data(self):
-        with open(self.DATA_FILE, 'w') as f:
-            json.dump(self.data, f, indent=4)
+        # Serialize here, where the data is only touched by the UI thread, and
+        # hand the bytes to the writer; a burst of saves collapses to the latest.
+        # Histories go to a new history file and the data file keeps only
+        # their locations, in the layout DataManager's lazy_history uses
+        meta = self.data['meta']
+        meta['generation'] = meta.get('generation', 0) + 1
+        history_name = f"{os.path.basename(self.DATA_FILE)}.history.{meta['generation']}"
+        headers = {}
+        histories = []
+        offset = 0
+        with open(self.history_path, 'rb') if self.history_path else nullcontext() as loaded:
+            for account_id, account in self.data['accounts'].items():
+                if 'transactions' in account:
+                    history = json.dumps(account['transactions'], separators=(',', ':')).encode()
+                else:
+                    # Never opened: copy the bytes instead of parsing them
+                    loaded.seek(account['history'][0])
+                    history = loaded.read(account['history'][1])
+                headers[account_id] = {key: value for key, value in account.items()
+                                       if key not in ('transactions', 'history')}
+                headers[account_id]['history'] = [offset, len(history)]
+                histories.append(history + b'\n')
+                offset += len(history) + 1
+        history = b''.join(histories)
+        meta.update(history_file=history_name, history_size=len(history), history_crc32=zlib.crc32(history))
+        snapshot = json.dumps(dict(self.data, accounts=headers), indent=4)
+        payload = (history_name, history, snapshot)
+        with self.save_condition:
+            self.pending_save = payload
+            self.save_condition.notify_all()
+
+    def save_worker(self):
+        while True:
+            with self.save_condition:
+                while self.pending_save is None:
+                    self.save_condition.wait()
+                (history_name, history, snapshot), self.pending_save = self.pending_save, None
+                self.saving = True
+
+            # Write the history file, then a temp file renamed over the data
+            # file, so a crash mid-write leaves the previous save intact
+            temp_file = self.DATA_FILE + '.tmp'
+            try:
+                with open(os.path.join(os.path.dirname(self.DATA_FILE), history_name), 'wb') as f:
+                    f.write(history)
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(temp_file, 'w') as f:
+                    f.write(snapshot)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_file, self.DATA_FILE)
+
+                # Unopened histories are still read from the loaded file, so
+                # only files written since startup are deleted here
+                if self.written_history_file not in (None, self.loaded_history_file):
+                    self.remove_history_file(self.written_history_file)
+                self.written_history_file = history_name
+            except OSError as e:
+                # Keep the writer alive; the next save retries with newer data
+                self.root.after(0, messagebox.showerror, "Save Error", f"Could not save data: {e}")
+            finally:
+                with self.save_condition:
+                    self.saving = False
+                    self.save_condition.notify_all()
+
+    def remove_history_file(self, name):
+        # Keep history files a DataManager generation can still fall back to
+        generations_file = self.DATA_FILE + '.generations'
+        if os.path.exists(generations_file):
+            with open(generations_file, 'r') as f:
+                if any(entry.get('history_file') == name for entry in json.load(f)):
+                    return
+        path = os.path.join(os.path.dirname(self.DATA_FILE), name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def flush_saves(self):
+        # Wait until the latest snapshot is on disk
+        with self.save_condition:
+            while self.pending_save is not None or self.saving:
+                self.save_condition.wait()
 
     def clear_frame(self):
         # Destroy all widgets in the main frame
         for widget in self.main_frame.winfo_children():
             widget.destroy()
 
+        # Admin dashboard widgets that receive incremental updates
+        self.user_tree = None
+        self.account_tree = None
+        self.owner_combobox = None
+
     def show_login(self):
         self.clear_frame()
 
@@ -106,7 +265,8 @@ class BankSystem:
             messagebox.showerror("Error", "Initial balance cannot be negative")
             return
 
-        account_id = f"ACC{len(self.data['accounts']) + 1:06d}"
+        account_id = f"ACC{self.data['meta']['next_account_number']:06d}"
+        self.data['meta']['next_account_number'] += 1
 
         self.data['accounts'][account_id] = {
             'owner': owner,
@@ -122,21 +282,38 @@ class BankSystem:
                 }
             ]
         }
+        self.owner_index.setdefault(owner, []).append(account_id)
 
         self.save_data()
         messagebox.showinfo("Success", f"Account {account_id} created successfully")
 
-        # Refresh the admin dashboard to show the new account
-        self.show_admin_dashboard()
+        # Add the new account to the admin dashboard without rebuilding it
+        if self.account_tree is not None:
+            self.account_tree.insert("", "end", iid=account_id, values=self.account_row_values(account_id))
 
     def login(self, username, password):
         if not username or not password:
             messagebox.showerror("Login Error", "Please enter both username and password")
             return
 
-        # Check if username exists and password matches
-        if (username in self.data['users'] and
-                self.data['users'][username]['password'] == hashlib.sha256(password.encode()).hexdigest()):
+        # Check the password on the worker and poll for the result, so the
+        # window stays responsive while the hash runs. Unknown usernames are
+        # checked against a dummy hash, so they take as long to refuse
+        user = self.data['users'].get(username)
+        future = self.auth_executor.submit(check_password, password, user['password'] if user else None)
+        self.root.after(20, self.finish_login, username, future)
+
+    def finish_login(self, username, future):
+        if not future.done():
+            self.root.after(20, self.finish_login, username, future)
+            return
+
+        matches, new_hash = future.result()
+        if matches:
+            # Upgrade a legacy or weaker hash while the password is at hand
+            if new_hash:
+                self.data['users'][username]['password'] = new_hash
+                self.save_data()
 
             self.current_user = username
             self.user_role = self.data['users'][username]['role']
@@ -249,7 +426,8 @@ class BankSystem:
 
         # Populate user data
         for username, user_data in self.data['users'].items():
-            user_tree.insert("", "end", values=(username, user_data['name'], user_data['role']))
+            user_tree.insert("", "end", iid=username, values=(username, user_data['name'], user_data['role']))
+        self.user_tree = user_tree
 
         # ACCOUNT MANAGEMENT TAB CONTENT
         # Create new account form
@@ -270,6 +448,7 @@ class BankSystem:
         if client_users:
             owner_combobox.current(0)
         owner_combobox.grid(row=0, column=1, sticky="w", pady=5)
+        self.owner_combobox = owner_combobox
 
         # Account Type
         ttk.Label(account_form_frame, text="Account Type:").grid(row=1, column=0, sticky="w", pady=5)
@@ -292,7 +471,7 @@ class BankSystem:
             command=lambda: self.create_account(
                 owner_var.get().split('(')[1].split(')')[0] if owner_var.get() else "",
                 type_var.get(),
-                balance_var.get()
+                self.to_cents(balance_var.get())
             )
         )
         create_account_button.grid(row=3, column=0, columnspan=2, pady=10)
@@ -332,18 +511,20 @@ class BankSystem:
                           lambda event: self.show_account_details(account_tree.item(account_tree.focus())["values"][0]))
 
         # Populate account data
-        for account_id, account_data in self.data['accounts'].items():
-            owner_name = self.data['users'][account_data['owner']]['name']
-            account_tree.insert(
-                "", "end",
-                values=(
-                    account_id,
-                    f"{owner_name} ({account_data['owner']})",
-                    account_data['type'],
-                    f"${account_data['balance']:.2f}",
-                    account_data['created_at']
-                )
-            )
+        for account_id in self.data['accounts']:
+            account_tree.insert("", "end", iid=account_id, values=self.account_row_values(account_id))
+        self.account_tree = account_tree
+
+    def account_row_values(self, account_id):
+        account_data = self.data['accounts'][account_id]
+        owner_name = self.data['users'][account_data['owner']]['name']
+        return (
+            account_id,
+            f"{owner_name} ({account_data['owner']})",
+            account_data['type'],
+            self.format_money(account_data['balance']),
+            account_data['created_at']
+        )
 
     def show_client_dashboard(self):
         self.clear_frame()
@@ -369,8 +550,8 @@ class BankSystem:
         ttk.Label(content_frame, text="Your Accounts", style="Header.TLabel").pack(anchor="w", pady=(0, 10))
 
         # Get user accounts
-        user_accounts = {acc_id: acc for acc_id, acc in self.data['accounts'].items()
-                         if acc['owner'] == self.current_user}
+        user_accounts = {acc_id: self.data['accounts'][acc_id]
+                         for acc_id in self.owner_index.get(self.current_user, [])}
 
         if user_accounts:
             for account_id, account in user_accounts.items():
@@ -383,7 +564,7 @@ class BankSystem:
                                                                                                          column=0,
                                                                                                          sticky="w")
                 ttk.Label(account_frame, text=f"Type: {account['type'].capitalize()}").grid(row=1, column=0, sticky="w")
-                ttk.Label(account_frame, text=f"Balance: ${account['balance']:.2f}", font=('Arial', 12, 'bold')).grid(
+                ttk.Label(account_frame, text=f"Balance: {self.format_money(account['balance'])}", font=('Arial', 12, 'bold')).grid(
                     row=0, column=1, sticky="e")
                 ttk.Label(account_frame, text=f"Created: {account['created_at']}").grid(row=1, column=1, sticky="e")
 
@@ -434,7 +615,7 @@ class BankSystem:
                                                                                                      sticky="w")
 
         ttk.Label(summary_frame, text="Current Balance:", font=('Arial', 12)).grid(row=1, column=1, sticky="e")
-        ttk.Label(summary_frame, text=f"${account['balance']:.2f}", font=('Arial', 18, 'bold')).grid(row=2, column=1,
+        ttk.Label(summary_frame, text=self.format_money(account['balance']), font=('Arial', 18, 'bold')).grid(row=2, column=1,
                                                                                                      sticky="e")
 
         # Transaction section
@@ -467,7 +648,7 @@ class BankSystem:
             command=lambda: self.process_transaction(
                 account_id,
                 transaction_type.get(),
-                amount_var.get(),
+                self.to_cents(amount_var.get()),
                 description_entry.get(),
                 detail_window  # Pass window to update it
             )
@@ -475,6 +656,7 @@ class BankSystem:
         submit_button.grid(row=3, column=0, columnspan=2, pady=10)
 
         # Transaction history section
+        transactions = self.account_transactions(account)
         history_frame = ttk.LabelFrame(main_frame, text="Transaction History", padding=10)
         history_frame.pack(fill=tk.BOTH, expand=True, pady=10)
 
@@ -486,9 +668,17 @@ class BankSystem:
         )
         transaction_tree.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
 
-        # Add scrollbar
+        # Add scrollbar; scrolling near the end loads the next page of history
         history_scroll = ttk.Scrollbar(history_frame, orient="vertical", command=transaction_tree.yview)
-        transaction_tree.configure(yscrollcommand=history_scroll.set)
+        history_loaded = [0]
+
+        def on_history_scroll(first, last):
+            history_scroll.set(first, last)
+            if float(last) > 0.9 and history_loaded[0] < len(transactions):
+                history_loaded[0] += self.load_transaction_page(
+                    transaction_tree, transactions, history_loaded[0], self.HISTORY_PAGE_SIZE)
+
+        transaction_tree.configure(yscrollcommand=on_history_scroll)
         history_scroll.pack(side=tk.RIGHT, fill="y")
 
         # Define headings
@@ -503,22 +693,30 @@ class BankSystem:
         transaction_tree.column("amount", width=100)
         transaction_tree.column("description", width=200)
 
-        # Populate transaction data (most recent first)
-        for transaction in reversed(account['transactions']):
+        # Populate the first pages of transaction data (most recent first)
+        history_loaded[0] = self.load_transaction_page(
+            transaction_tree, transactions, 0, self.HISTORY_PAGE_SIZE * 3)
+
+        # Close button
+        close_button = ttk.Button(main_frame, text="Close", command=detail_window.destroy)
+        close_button.pack(pady=10)
+
+    def load_transaction_page(self, transaction_tree, transactions, offset, limit):
+        # Insert up to limit transactions, counting back from the newest one
+        end = len(transactions) - offset
+        page = transactions[max(end - limit, 0):end] if end > 0 else []
+        for transaction in reversed(page):
             transaction_tree.insert(
                 "", "end",
                 values=(
                     transaction['date'],
                     transaction['type'].capitalize(),
-                    f"${transaction['amount']:.2f}" if transaction[
-                                                           'type'] == 'deposit' else f"-${transaction['amount']:.2f}",
+                    self.format_money(
+                        transaction['amount'] if transaction['type'] == 'deposit' else -transaction['amount']),
                     transaction['description']
                 )
             )
-
-        # Close button
-        close_button = ttk.Button(main_frame, text="Close", command=detail_window.destroy)
-        close_button.pack(pady=10)
+        return len(page)
 
     def create_user(self, username, password, name, role):
         if not username or not password or not name:
@@ -530,7 +728,7 @@ class BankSystem:
             return
 
         self.data['users'][username] = {
-            'password': hashlib.sha256(password.encode()).hexdigest(),
+            'password': hash_password(password),
             'role': role,
             'name': name
         }
@@ -538,8 +736,11 @@ class BankSystem:
         self.save_data()
         messagebox.showinfo("Success", f"User {username} created successfully")
 
-        # Refresh the admin dashboard to show the new user
-        self.show_admin_dashboard()
+        # Add the new user to the admin dashboard without rebuilding it
+        if self.user_tree is not None:
+            self.user_tree.insert("", "end", iid=username, values=(username, name, role))
+            if role == 'client':
+                self.owner_combobox['values'] = (*self.owner_combobox['values'], f"{name} ({username})")
 
     def create_account(self, owner, account_type, initial_balance):
         if not owner:
@@ -550,7 +751,8 @@ class BankSystem:
             messagebox.showerror("Error", "Initial balance cannot be negative")
             return
 
-        account_id = f"ACC{len(self.data['accounts']) + 1:06d}"
+        account_id = f"ACC{self.data['meta']['next_account_number']:06d}"
+        self.data['meta']['next_account_number'] += 1
 
         self.data['accounts'][account_id] = {
             'owner': owner,
@@ -566,12 +768,14 @@ class BankSystem:
                 }
             ]
         }
+        self.owner_index.setdefault(owner, []).append(account_id)
 
         self.save_data()
         messagebox.showinfo("Success", f"Account {account_id} created successfully")
 
-        # Refresh the admin dashboard to show the new account
-        self.show_admin_dashboard()
+        # Add the new account to the admin dashboard without rebuilding it
+        if self.account_tree is not None:
+            self.account_tree.insert("", "end", iid=account_id, values=self.account_row_values(account_id))
 
     def process_transaction(self, account_id, transaction_type, amount, description, window=None):
         if amount <= 0:
@@ -590,7 +794,7 @@ class BankSystem:
             account['balance'] -= amount
 
         # Add transaction record
-        account['transactions'].append({
+        self.account_transactions(account).append({
             'type': transaction_type,
             'amount': amount,
             'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
@@ -600,6 +804,10 @@ class BankSystem:
         self.save_data()
         messagebox.showinfo("Success", "Transaction completed successfully")
 
+        # Keep the admin account list's balance current
+        if self.account_tree is not None:
+            self.account_tree.item(account_id, values=self.account_row_values(account_id))
+
         # Refresh views
         if window:
             window.destroy()
@@ -611,6 +819,11 @@ class BankSystem:
 
     def run(self):
         self.root.mainloop()
+        self.flush_saves()
+
+        # Nothing reads the loaded history file any more once a newer one is saved
+        if self.written_history_file and self.loaded_history_file not in (None, self.written_history_file):
+            self.remove_history_file(self.loaded_history_file)
 
 
 if __name__ == "__main__":
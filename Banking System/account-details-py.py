@@ -1,7 +1,12 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
+from money import to_cents, format_money
 
 class AccountDetailsWindow:
+    # Rows fetched per history page, and pages kept loaded ahead of the view
+    HISTORY_PAGE_SIZE = 50
+    HISTORY_PREFETCH_PAGES = 2
+    
     def __init__(self, parent, data_manager, account_id, user_role, current_user, refresh_callback=None):
         self.parent = parent
         self.data_manager = data_manager
@@ -60,7 +65,7 @@ class AccountDetailsWindow:
         ttk.Label(summary_frame, text=f"Owner: {owner_name}").grid(row=3, column=0, sticky="w")
         
         ttk.Label(summary_frame, text="Current Balance:", font=('Arial', 12)).grid(row=1, column=1, sticky="e")
-        ttk.Label(summary_frame, text=f"${self.account['balance']:.2f}", font=('Arial', 18, 'bold')).grid(row=2, column=1, sticky="e")
+        ttk.Label(summary_frame, text=format_money(self.account['balance']), font=('Arial', 18, 'bold')).grid(row=2, column=1, sticky="e")
     
     def _setup_transaction_section(self, parent):
         transaction_frame = ttk.LabelFrame(parent, text="Make Transaction", padding=10)
@@ -91,7 +96,7 @@ class AccountDetailsWindow:
             text="Submit Transaction",
             command=lambda: self._process_transaction(
                 transaction_type.get(),
-                amount_var.get(),
+                to_cents(amount_var.get()),
                 description_entry.get()
             )
         )
@@ -109,11 +114,65 @@ class AccountDetailsWindow:
         )
         transaction_tree.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
         
-        # Add scrollbar
+        # Add scrollbar; scrolling near the end fetches the next page
         history_scroll = ttk.Scrollbar(history_frame, orient="vertical", command=transaction_tree.yview)
-        transaction_tree.configure(yscrollcommand=history_scroll.set)
+        transaction_tree.configure(
+            yscrollcommand=lambda first, last: self._on_history_scroll(history_scroll, first, last)
+        )
         history_scroll.pack(side=tk.RIGHT, fill="y")
         
         # Define headings
         transaction_tree.heading("date", text="Date")
-        
\ No newline at end of file
+        transaction_tree.heading("type", text="Type")
+        transaction_tree.heading("amount", text="Amount")
+        transaction_tree.heading("description", text="Description")
+        
+        # Define column widths
+        transaction_tree.column("date", width=150)
+        transaction_tree.column("type", width=100)
+        transaction_tree.column("amount", width=100)
+        transaction_tree.column("description", width=200)
+        
+        # Populate the first page (most recent first) plus the prefetch window
+        self.transaction_tree = transaction_tree
+        self.history_loaded = 0
+        self.history_total = self.data_manager.get_transaction_count(self.account_id)
+        self._load_history_page(self.HISTORY_PAGE_SIZE * (1 + self.HISTORY_PREFETCH_PAGES))
+    
+    def _on_history_scroll(self, scrollbar, first, last):
+        scrollbar.set(first, last)
+        
+        # Keep the prefetch window ahead of the visible rows
+        if float(last) > 0.9 and self.history_loaded < self.history_total:
+            self._load_history_page(self.HISTORY_PAGE_SIZE)
+    
+    def _load_history_page(self, limit):
+        transactions = self.data_manager.get_transactions(
+            self.account_id, offset=self.history_loaded, limit=limit
+        )
+        for transaction in transactions:
+            self.transaction_tree.insert(
+                "", "end",
+                values=(
+                    transaction['date'],
+                    transaction['type'].capitalize(),
+                    format_money(transaction['amount'] if transaction['type'] == 'deposit' else -transaction['amount']),
+                    transaction['description']
+                )
+            )
+        self.history_loaded += len(transactions)
+    
+    def _process_transaction(self, transaction_type, amount, description):
+        success, message = self.data_manager.process_transaction(
+            self.account_id, transaction_type, amount, description
+        )
+        if not success:
+            messagebox.showerror("Error", message)
+            return
+        
+        messagebox.showinfo("Success", message)
+        
+        # Refresh views
+        self.window.destroy()
+        if self.refresh_callback:
+            self.refresh_callback()
@@ -1,5 +1,6 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
+from money import to_cents, format_money
 
 class AdminDashboard:
     def __init__(self, master, data_manager, user_data, logout_callback, show_account_details_callback):
@@ -9,6 +10,9 @@ class AdminDashboard:
         self.logout_callback = logout_callback
         self.show_account_details_callback = show_account_details_callback
         self.frame = None
+        self.user_tree = None
+        self.account_tree = None
+        self.owner_combobox = None
     
     def show(self):
         # Clear previous content
@@ -17,6 +21,10 @@ class AdminDashboard:
         
         self.frame = ttk.Frame(self.master)
         self.frame.pack(fill=tk.BOTH, expand=True)
+
+        # Apply DataManager changes to the live Treeviews instead of rebuilding
+        self.data_manager.add_listener(self._on_data_change)
+        self.frame.bind("<Destroy>", lambda event: self.data_manager.remove_listener(self._on_data_change))
         
         # Create a notebook (tab control)
         notebook = ttk.Notebook(self.frame)
@@ -115,8 +123,9 @@ class AdminDashboard:
         user_scroll.pack(side="right", fill="y")
 
         # Populate user data
+        self.user_tree = user_tree
         for username, user_data in self.data_manager.get_users().items():
-            user_tree.insert("", "end", values=(username, user_data['name'], user_data['role']))
+            self._insert_user_row(username, user_data)
 
     def _setup_account_management_tab(self, frame):
         # Create new account form
@@ -137,6 +146,7 @@ class AdminDashboard:
         if client_users:
             owner_combobox.current(0)
         owner_combobox.grid(row=0, column=1, sticky="w", pady=5)
+        self.owner_combobox = owner_combobox
 
         # Account Type
         ttk.Label(account_form_frame, text="Account Type:").grid(row=1, column=0, sticky="w", pady=5)
@@ -159,7 +169,7 @@ class AdminDashboard:
             command=lambda: self._create_account(
                 owner_var.get().split('(')[1].split(')')[0] if owner_var.get() else "",
                 type_var.get(),
-                balance_var.get()
+                to_cents(balance_var.get())
             )
         )
         create_account_button.grid(row=3, column=0, columnspan=2, pady=10)
@@ -167,6 +177,10 @@ class AdminDashboard:
         # Account List
         ttk.Label(frame, text="Account List", style="Header.TLabel").pack(anchor="w", pady=(20, 10))
 
+        # Totals per account type, kept up to date by the data manager
+        self.account_summary = ttk.Label(frame, text=self._account_summary())
+        self.account_summary.pack(anchor="w", pady=(0, 10))
+
         # Create Treeview for account list
         account_tree = ttk.Treeview(
             frame,
@@ -200,18 +214,45 @@ class AdminDashboard:
                             account_tree.item(account_tree.focus())["values"][0]))
 
         # Populate account data
+        self.account_tree = account_tree
         for account_id, account_data in self.data_manager.get_accounts().items():
-            owner_name = self.data_manager.get_user_data(account_data['owner'])['name']
-            account_tree.insert(
-                "", "end",
-                values=(
-                    account_id,
-                    f"{owner_name} ({account_data['owner']})",
-                    account_data['type'],
-                    f"${account_data['balance']:.2f}",
-                    account_data['created_at']
-                )
-            )
+            self.account_tree.insert("", "end", iid=account_id, values=self._account_row(account_id, account_data))
+
+    def _insert_user_row(self, username, user_data):
+        self.user_tree.insert("", "end", iid=username, values=(username, user_data['name'], user_data['role']))
+
+    def _account_row(self, account_id, account_data):
+        # Files written before owners were checked may name unknown users
+        owner = self.data_manager.get_user_data(account_data['owner'])
+        owner_name = owner['name'] if owner else "Unknown"
+        return (
+            account_id,
+            f"{owner_name} ({account_data['owner']})",
+            account_data['type'],
+            format_money(account_data['balance']),
+            account_data['created_at']
+        )
+
+    def _account_summary(self):
+        totals = self.data_manager.get_balance_by_type()
+        return "   ".join(f"{account_type.capitalize()}: {summary['accounts']} accounts, "
+                           f"{format_money(summary['balance'])}"
+                           for account_type, summary in sorted(totals.items())) or "No accounts"
+
+    def _on_data_change(self, event, key):
+        # Each change touches a single row
+        if event == 'user_added':
+            user_data = self.data_manager.get_user_data(key)
+            self._insert_user_row(key, user_data)
+            if user_data['role'] == 'client':
+                self.owner_combobox['values'] = (*self.owner_combobox['values'], f"{user_data['name']} ({key})")
+        elif event == 'account_created':
+            account_data = self.data_manager.get_account(key)
+            self.account_tree.insert("", "end", iid=key, values=self._account_row(key, account_data))
+        elif event == 'account_updated' and self.account_tree.exists(key):
+            self.account_tree.item(key, values=self._account_row(key, self.data_manager.get_account(key)))
+        if event in ('account_created', 'account_updated'):
+            self.account_summary.configure(text=self._account_summary())
 
     def _create_user(self, username, password, name, role):
         if not username or not password or not name:
@@ -221,7 +262,6 @@ class AdminDashboard:
         success, message = self.data_manager.add_user(username, password, name, role)
         if success:
             messagebox.showinfo("Success", message)
-            self.show()  # Refresh the view
         else:
             messagebox.showerror("Error", message)
 
@@ -234,6 +274,9 @@ class AdminDashboard:
             messagebox.showerror("Error", "Initial balance cannot be negative")
             return
         
-        account_id = self.data_manager.create_account(owner, account_type, initial_balance)
+        try:
+            account_id = self.data_manager.create_account(owner, account_type, initial_balance)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
         messagebox.showinfo("Success", f"Account {account_id} created successfully")
-        self.show()  # Refresh the view
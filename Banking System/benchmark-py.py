@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import platform
+import tempfile
+import tracemalloc
+
+from data_manager import DataManager
+from security import hash_password
+
+# Named dataset sizes as (users, accounts, transactions)
+DATASET_SIZES = {
+    'small': (100, 200, 2000),
+    'medium': (1000, 2000, 50000),
+    'large': (10000, 20000, 500000)
+}
+
+ACCOUNT_TYPES = ('checking', 'savings', 'investment')
+
+# Every generated user has this password
+PASSWORD = 'password'
+
+def generate_data(users, accounts, transactions, seed=0):
+    """Build a synthetic bank in the bank_data.json schema
+    
+    Accounts are owned by random users and transactions are spread over
+    random accounts. Every account starts with an initial deposit (counted
+    in transactions), histories are in date order and balances match them.
+    """
+    rng = random.Random(seed)
+    # One hash shared by every user; the KDF is too slow to run per user
+    password_hash = hash_password(PASSWORD)
+    
+    data = {
+        'users': {
+            'admin': {
+                'password': hash_password('admin123'),
+                'role': 'admin',
+                'name': 'System Administrator'
+            }
+        },
+        'accounts': {},
+        'meta': {'amount_unit': 'cents', 'next_account_number': accounts + 1}
+    }
+    usernames = [f"user{n:06d}" for n in range(users)]
+    for username in usernames:
+        data['users'][username] = {'password': password_hash, 'role': 'client', 'name': f"User {username[4:]}"}
+    
+    counts = [1] * accounts
+    for _ in range(max(transactions - accounts, 0)):
+        counts[rng.randrange(accounts)] += 1
+    
+    start = datetime.datetime(2020, 1, 1)
+    for number, count in enumerate(counts, 1):
+        date = start + datetime.timedelta(seconds=rng.randrange(86400 * 365))
+        balance = rng.randrange(1000, 100000)
+        history = [{
+            'type': 'deposit',
+            'amount': balance,
+            'date': date.strftime('%Y-%m-%d %H:%M:%S'),
+            'description': 'Initial deposit'
+        }]
+        created_at = history[0]['date']
+        for _ in range(count - 1):
+            date += datetime.timedelta(seconds=rng.randrange(1, 86400 * 3))
+            amount = rng.randrange(100, 50000)
+            transaction_type = 'withdraw' if amount <= balance and rng.random() < 0.4 else 'deposit'
+            balance += amount if transaction_type == 'deposit' else -amount
+            history.append({
+                'type': transaction_type,
+                'amount': amount,
+                'date': date.strftime('%Y-%m-%d %H:%M:%S'),
+                'description': f"{transaction_type.capitalize()} transaction"
+            })
+        
+        data['accounts'][f"ACC{number:06d}"] = {
+            'owner': rng.choice(usernames),
+            'type': rng.choice(ACCOUNT_TYPES),
+            'balance': balance,
+            'created_at': created_at,
+            'transactions': history
+        }
+    return data
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def measure(operation, iterations, memory_iterations=3):
+    """Time operation(i) for each iteration and measure its peak allocation
+    
+    Latencies come from an untraced pass; peak memory from a separate short
+    pass under tracemalloc, since tracing slows every allocation down.
+    """
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        begin = time.perf_counter_ns()
+        operation(i)
+        latencies.append(time.perf_counter_ns() - begin)
+    elapsed = time.perf_counter() - started
+    
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for i in range(iterations, iterations + min(memory_iterations, iterations)):
+        operation(i)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'throughput_ops': iterations / elapsed if elapsed else None,
+        'latency_us': {
+            'mean': sum(latencies) / len(latencies) / 1000,
+            'p50': percentile(latencies, 0.50) / 1000,
+            'p90': percentile(latencies, 0.90) / 1000,
+            'p99': percentile(latencies, 0.99) / 1000,
+            'max': latencies[-1] / 1000
+        },
+        'peak_memory_bytes': peak
+    }
+
+def run_dataset(name, users, accounts, transactions, args):
+    """Benchmark every hot path against one generated dataset"""
+    rng = random.Random(args.seed)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        data_file = os.path.join(directory, 'bank_data.json')
+        with open(data_file, 'w') as f:
+            json.dump(generate_data(users, accounts, transactions, args.seed), f, indent=4)
+        
+        def open_manager():
+            return DataManager(data_file, journal=args.journal, lazy_history=args.lazy_history,
+                               storage_format=args.storage_format, compression=args.compression)
+        
+        data_manager = open_manager()
+        usernames = [username for username in data_manager.get_users() if username != 'admin']
+        account_ids = list(data_manager.get_accounts())
+        
+        operations = [
+            ('authenticate_user', args.auth_iterations,
+             lambda i: data_manager.authenticate_user(rng.choice(usernames), PASSWORD)),
+            ('get_user_accounts', args.iterations,
+             lambda i: data_manager.get_user_accounts(rng.choice(usernames))),
+            ('process_transaction', args.write_iterations,
+             lambda i: data_manager.process_transaction(rng.choice(account_ids), 'deposit', 100, '')),
+            ('create_account', args.write_iterations,
+             lambda i: data_manager.create_account(rng.choice(usernames), rng.choice(ACCOUNT_TYPES), 100)),
+            ('save_data', args.snapshot_iterations, lambda i: data_manager.save_data()),
+            ('load_data', args.snapshot_iterations, lambda i: open_manager())
+        ]
+        for operation, iterations, run in operations:
+            if args.operations and operation not in args.operations:
+                continue
+            result = measure(run, iterations)
+            result.update({
+                'dataset': name,
+                'users': users,
+                'accounts': accounts,
+                'transactions': transactions,
+                'operation': operation
+            })
+            results.append(result)
+            print(f"{name:>8} {operation:<20} {result['throughput_ops']:>12.1f} ops/s"
+                  f"  p50 {result['latency_us']['p50']:>10.1f}us"
+                  f"  p99 {result['latency_us']['p99']:>10.1f}us"
+                  f"  peak {result['peak_memory_bytes'] / 1024:>10.1f}KiB", file=sys.stderr)
+    return results
+
+def parse_size(size):
+    """Parse a named size or USERS:ACCOUNTS:TRANSACTIONS"""
+    if size in DATASET_SIZES:
+        return size, DATASET_SIZES[size]
+    try:
+        users, accounts, transactions = (int(part) for part in size.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected one of {', '.join(DATASET_SIZES)} or USERS:ACCOUNTS:TRANSACTIONS")
+    return size, (users, accounts, transactions)
+
+def compare(results, baseline_file):
+    """Print the p50 latency change of each result against a previous run"""
+    with open(baseline_file, 'r') as f:
+        baseline = {(r['dataset'], r['operation']): r for r in json.load(f)['results']}
+    for result in results:
+        previous = baseline.get((result['dataset'], result['operation']))
+        if previous:
+            ratio = result['latency_us']['p50'] / previous['latency_us']['p50']
+            print(f"{result['dataset']:>8} {result['operation']:<20} p50 x{ratio:.2f} vs baseline", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the DataManager hot paths on synthetic datasets")
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=[parse_size('small'), parse_size('medium')],
+                        help="named sizes (small, medium, large) or USERS:ACCOUNTS:TRANSACTIONS")
+    parser.add_argument('--operations', nargs='+', help="only run these operations")
+    parser.add_argument('--iterations', type=int, default=10000, help="iterations of read operations")
+    parser.add_argument('--auth-iterations', type=int, default=20, help="iterations of authenticate_user")
+    parser.add_argument('--write-iterations', type=int, default=200, help="iterations of write operations")
+    parser.add_argument('--snapshot-iterations', type=int, default=5, help="iterations of save_data and load_data")
+    parser.add_argument('--journal', action='store_true', help="append writes to the journal")
+    parser.add_argument('--lazy-history', action='store_true', help="use split snapshots")
+    parser.add_argument('--storage-format', choices=('json', 'binary'), default='json', help="snapshot format")
+    parser.add_argument('--compression', choices=('none', 'zlib'), help="compression of binary snapshots")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write JSON results to this file instead of stdout")
+    parser.add_argument('--baseline', help="compare against the JSON results of a previous run")
+    args = parser.parse_args()
+    
+    results = []
+    for name, (users, accounts, transactions) in args.sizes:
+        results.extend(run_dataset(name, users, accounts, transactions, args))
+    
+    report = {
+        'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'journal': args.journal,
+            'lazy_history': args.lazy_history,
+            'storage_format': args.storage_format,
+            'compression': args.compression,
+            'seed': args.seed
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+    
+    if args.baseline:
+        compare(results, args.baseline)
+
+if __name__ == "__main__":
+    main()
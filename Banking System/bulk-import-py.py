@@ -0,0 +1,229 @@
+import os
+import sys
+import csv
+import json
+import argparse
+import datetime
+from decimal import InvalidOperation
+from concurrent.futures import ProcessPoolExecutor
+
+from data_manager import DataManager
+from money import to_cents
+from security import hash_password
+
+ACCOUNT_TYPES = ('checking', 'savings', 'investment')
+ROLES = ('client', 'admin')
+
+# Each PBKDF2 hash takes a few hundred milliseconds, so anything beyond a
+# handful of passwords is hashed on a process pool. Tasks are a few passwords
+# each, so small imports still spread over every worker
+SERIAL_HASH_LIMIT = 4
+HASH_CHUNK_SIZE = 16
+
+class BulkImportError(ValueError):
+    """Input files failed validation; errors lists every problem found"""
+    
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} problems found, first: {errors[0]}")
+        self.errors = errors
+
+def read_rows(path, errors):
+    """Yield (line number, row dict) from a .csv file with a header or a .jsonl file"""
+    with open(path, 'r', newline='') as f:
+        if not path.endswith('.jsonl'):
+            for number, row in enumerate(csv.DictReader(f), 2):
+                yield number, row
+            return
+        
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                errors.append(f"{path}:{number}: invalid JSON: {e}")
+
+def _parse_date(value):
+    """Normalize a date string to the stored format, or None if it isn't a date"""
+    try:
+        return datetime.datetime.fromisoformat(str(value)).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+def _parse_amount(value):
+    """Convert an amount in currency units to cents, or None if it isn't one"""
+    try:
+        return to_cents(value)
+    except (InvalidOperation, ValueError):
+        return None
+
+def _parse_users(path, data_manager, errors):
+    """Read username, password, name and role columns; returns {username: (password, name, role)}"""
+    users = {}
+    for number, row in read_rows(path, errors):
+        where = f"{path}:{number}"
+        username = str(row.get('username') or '').strip()
+        password = str(row.get('password') or '')
+        role = row.get('role') or 'client'
+        if not username or not password:
+            errors.append(f"{where}: username and password are required")
+        elif username in users or data_manager.get_user_data(username):
+            errors.append(f"{where}: username {username} already exists")
+        elif role not in ROLES:
+            errors.append(f"{where}: invalid role {role}")
+        else:
+            users[username] = (password, row.get('name') or username, role)
+    return users
+
+def _parse_accounts(path, data_manager, users, errors):
+    """Read ref, owner, type, opening_balance and created_at columns
+    
+    ref is the account's ID in the source system, used by the transactions
+    file. Returns a list of (ref, account dict) in file order.
+    """
+    accounts = []
+    refs = set()
+    for number, row in read_rows(path, errors):
+        where = f"{path}:{number}"
+        ref = str(row.get('ref') or '')
+        owner = row.get('owner')
+        opening_balance = _parse_amount(row.get('opening_balance') or 0)
+        created_at = _parse_date(row['created_at']) if row.get('created_at') else \
+            datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        if ref and ref in refs:
+            errors.append(f"{where}: duplicate ref {ref}")
+        elif owner not in users and not data_manager.get_user_data(owner):
+            errors.append(f"{where}: unknown owner {owner}")
+        elif row.get('type') not in ACCOUNT_TYPES:
+            errors.append(f"{where}: invalid account type {row.get('type')}")
+        elif opening_balance is None or opening_balance < 0:
+            errors.append(f"{where}: invalid opening balance {row.get('opening_balance')}")
+        elif created_at is None:
+            errors.append(f"{where}: invalid date {row.get('created_at')}")
+        else:
+            refs.add(ref)
+            accounts.append((ref, {
+                'owner': owner,
+                'type': row['type'],
+                'balance': opening_balance,
+                'created_at': created_at,
+                'transactions': [
+                    {
+                        'type': 'deposit',
+                        'amount': opening_balance,
+                        'date': created_at,
+                        'description': 'Initial deposit'
+                    }
+                ]
+            }))
+    return accounts
+
+def _parse_transactions(path, accounts, errors):
+    """Read account (a ref), type, amount, date and description columns
+    
+    Each account's transactions are applied in date order on top of its
+    opening balance; a withdrawal that would overdraw it, or a transaction
+    dated before the account was created, is an error.
+    """
+    pending = {}
+    for number, row in read_rows(path, errors):
+        where = f"{path}:{number}"
+        transaction_type = row.get('type')
+        amount = _parse_amount(row.get('amount'))
+        date = _parse_date(row.get('date'))
+        if row.get('account') not in accounts:
+            errors.append(f"{where}: unknown account {row.get('account')}")
+        elif transaction_type not in ('deposit', 'withdraw'):
+            errors.append(f"{where}: invalid transaction type {transaction_type}")
+        elif amount is None or amount <= 0:
+            errors.append(f"{where}: invalid amount {row.get('amount')}")
+        elif date is None:
+            errors.append(f"{where}: invalid date {row.get('date')}")
+        elif date < accounts[row['account']]['created_at']:
+            # Histories must stay in date order for point-in-time queries
+            errors.append(f"{where}: dated before account {row['account']} was created")
+        else:
+            pending.setdefault(row['account'], []).append((date, where, {
+                'type': transaction_type,
+                'amount': amount,
+                'date': date,
+                'description': row.get('description') or f"{transaction_type.capitalize()} transaction"
+            }))
+    
+    for ref, transactions in pending.items():
+        account = accounts[ref]
+        transactions.sort(key=lambda item: item[0])
+        for _, where, transaction in transactions:
+            if transaction['type'] == 'withdraw' and transaction['amount'] > account['balance']:
+                errors.append(f"{where}: withdrawal would overdraw account {ref}")
+                break
+            account['balance'] += transaction['amount'] if transaction['type'] == 'deposit' else -transaction['amount']
+            account['transactions'].append(transaction)
+
+def hash_passwords(passwords, workers=None):
+    """Hash passwords in order, on a pool of worker processes unless there are only a few"""
+    if len(passwords) <= SERIAL_HASH_LIMIT:
+        return [hash_password(password) for password in passwords]
+    workers = workers or os.cpu_count() or 1
+    # At least four tasks per worker, so none is left idle while others finish
+    chunksize = max(1, min(HASH_CHUNK_SIZE, len(passwords) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(hash_password, passwords, chunksize=chunksize))
+
+def bulk_import(data_manager, users_file=None, accounts_file=None, transactions_file=None, workers=None):
+    """Validate the input files and add everything in them with one commit
+    
+    Amounts in the files are in currency units, e.g. 12.34. Raises
+    BulkImportError listing every problem found, in which case nothing is
+    written. Returns a summary including the ref -> account ID mapping.
+    """
+    errors = []
+    users = _parse_users(users_file, data_manager, errors) if users_file else {}
+    accounts = _parse_accounts(accounts_file, data_manager, users, errors) if accounts_file else []
+    if transactions_file:
+        _parse_transactions(transactions_file, {ref: account for ref, account in accounts if ref}, errors)
+    if errors:
+        raise BulkImportError(errors)
+    
+    hashes = hash_passwords([password for password, _, _ in users.values()], workers)
+    account_ids = data_manager.bulk_create(
+        {username: {'password': password_hash, 'role': role, 'name': name}
+         for (username, (_, name, role)), password_hash in zip(users.items(), hashes)},
+        [account for _, account in accounts]
+    )
+    return {
+        'users': len(users),
+        'accounts': len(account_ids),
+        'transactions': sum(len(account['transactions']) for _, account in accounts),
+        'account_ids': {ref: account_id for (ref, _), account_id in zip(accounts, account_ids) if ref}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Import users, accounts and transaction histories in one commit")
+    parser.add_argument('--data-file', default='data/bank_data.json')
+    parser.add_argument('--users', help="CSV or JSONL with username, password, name, role")
+    parser.add_argument('--accounts', help="CSV or JSONL with ref, owner, type, opening_balance, created_at")
+    parser.add_argument('--transactions', help="CSV or JSONL with account (a ref), type, amount, date, description")
+    parser.add_argument('--workers', type=int, help="password hashing processes (default: one per CPU)")
+    parser.add_argument('--id-map', help="write the ref -> account ID mapping to this CSV file")
+    args = parser.parse_args()
+    
+    data_manager = DataManager(args.data_file, journal=True)
+    try:
+        summary = bulk_import(data_manager, args.users, args.accounts, args.transactions, args.workers)
+    except BulkImportError as e:
+        for error in e.errors:
+            print(error, file=sys.stderr)
+        sys.exit(1)
+    
+    if args.id_map:
+        with open(args.id_map, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('ref', 'account_id'))
+            writer.writerows(summary['account_ids'].items())
+    print(f"Imported {summary['users']} users, {summary['accounts']} accounts "
+          f"and {summary['transactions']} transactions")
+
+if __name__ == "__main__":
+    main()
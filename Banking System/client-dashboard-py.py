@@ -1,5 +1,6 @@
 import tkinter as tk
 from tkinter import ttk
+from money import format_money
 
 class ClientDashboard:
     def __init__(self, master, data_manager, username, user_data, logout_callback, show_account_details_callback):
@@ -53,7 +54,7 @@ class ClientDashboard:
                                                                                                   column=0,
                                                                                                   sticky="w")
                 ttk.Label(account_frame, text=f"Type: {account['type'].capitalize()}").grid(row=1, column=0, sticky="w")
-                ttk.Label(account_frame, text=f"Balance: ${account['balance']:.2f}", font=('Arial', 12, 'bold')).grid(
+                ttk.Label(account_frame, text=f"Balance: {format_money(account['balance'])}", font=('Arial', 12, 'bold')).grid(
                     row=0, column=1, sticky="e")
                 ttk.Label(account_frame, text=f"Created: {account['created_at']}").grid(row=1, column=1, sticky="e")
 
@@ -0,0 +1,1594 @@
+import os
+import json
+import zlib
+import shutil
+import datetime
+import time
+import heapq
+import struct
+import threading
+import warnings
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import Future
+from contextlib import ExitStack, nullcontext
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import accumulate
+
+import snapshot_format
+from metrics import SIZE_BUCKETS, TimedLock
+from security import hash_password, check_password
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Amounts and balances are stored as int64 cents
+MAX_CENTS = 2 ** 63 - 1
+
+# Accounts kept in the cached top-accounts ranking
+TOP_ACCOUNTS_TRACKED = 100
+
+# Accounts share a fixed pool of locks picked by hash, so locking every
+# account, as an interest run does, creates no locks
+ACCOUNT_LOCK_STRIPES = 1024
+
+class ChecksumWriter:
+    """Binary file wrapper that encodes text and tracks the size and CRC-32 written"""
+    __slots__ = ('file', 'size', 'crc32')
+    
+    def __init__(self, f):
+        self.file = f
+        self.size = 0
+        self.crc32 = 0
+    
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.crc32 = zlib.crc32(data, self.crc32)
+        self.size += len(data)
+        self.file.write(data)
+
+def replace_file(path, write):
+    """Atomically replace path with what write(file) writes; returns (size, crc32)
+    
+    The content goes to a temp file that is fsynced and renamed over path, so
+    readers and crashes see either the old file or the new one, never a mix.
+    """
+    temp_file = path + '.tmp'
+    with open(temp_file, 'wb') as f:
+        writer = ChecksumWriter(f)
+        write(writer)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+    # The rename itself is durable only once the directory is synced
+    if os.name != 'nt':
+        fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    return writer.size, writer.crc32
+
+def to_timestamp(value):
+    """Seconds since EPOCH for a datetime or an ISO date string such as '2024-03-01 12:00:00'"""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    delta = value - EPOCH
+    return delta.days * 86400 + delta.seconds
+
+class StringTable:
+    """Interned strings referenced by integer IDs"""
+    __slots__ = ('strings', 'ids')
+    
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+    
+    def intern(self, value):
+        """Return the ID for value, adding it to the table if needed"""
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+    
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+# Transaction types and descriptions repeat heavily, so they are stored once
+STRINGS = StringTable()
+
+# Guards lazy loading of histories that are still on disk
+HISTORY_LOCK = threading.Lock()
+
+class Transaction:
+    """Read-only view of one transaction, indexable like the JSON dict
+    
+    balance is the account balance right after the transaction; it is
+    derived from the history and not part of the stored record.
+    """
+    __slots__ = ('type', 'amount', 'date', 'description', 'balance')
+    
+    def __init__(self, transaction_type, amount, date, description, balance=None):
+        self.type = transaction_type
+        self.amount = amount
+        self.date = date
+        self.description = description
+        self.balance = balance
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+    
+    def to_dict(self):
+        return {'type': self.type, 'amount': self.amount, 'date': self.date, 'description': self.description}
+
+class TransactionLog:
+    """Columnar transaction history of one account
+    
+    Amounts (cents) and timestamps (seconds since EPOCH) are kept in typed
+    arrays, and types and descriptions as IDs into STRINGS. Indexing and
+    iteration produce Transaction views.
+    
+    The running balance after each transaction is kept alongside. Histories
+    are appended in date order, so the timestamps double as a sorted index
+    for point-in-time queries.
+    """
+    __slots__ = ('types', 'amounts', 'timestamps', 'descriptions', 'balances')
+    
+    def __init__(self, transactions=()):
+        self.types = array('I')
+        self.amounts = array('q')
+        self.timestamps = array('q')
+        self.descriptions = array('I')
+        self.balances = array('q')
+        for transaction in transactions:
+            self.append(transaction)
+    
+    @classmethod
+    def from_columns(cls, types, amounts, timestamps, descriptions):
+        """Build a log from decoded columns, recomputing the running balances"""
+        log = cls()
+        log.types = types
+        log.amounts = amounts
+        log.timestamps = timestamps
+        log.descriptions = descriptions
+        deposit = STRINGS.intern('deposit')
+        withdraw = STRINGS.intern('withdraw')
+        log.balances = array('q', accumulate(
+            amount if transaction_type == deposit else -amount if transaction_type == withdraw else 0
+            for transaction_type, amount in zip(types, amounts)))
+        return log
+    
+    def append(self, transaction):
+        """Append a transaction given in the JSON dict layout
+        
+        Everything is converted and range-checked before any column grows,
+        so a rejected transaction leaves the columns in step.
+        """
+        amount = transaction['amount']
+        balance = self.balances[-1] if self.balances else 0
+        if transaction['type'] == 'deposit':
+            balance += amount
+        elif transaction['type'] == 'withdraw':
+            balance -= amount
+        if not (-MAX_CENTS <= amount <= MAX_CENTS and -MAX_CENTS <= balance <= MAX_CENTS):
+            raise OverflowError("Amount or balance out of range")
+        
+        timestamp = to_timestamp(transaction['date'])
+        transaction_type = STRINGS.intern(transaction['type'])
+        description = STRINGS.intern(transaction['description'])
+        self.types.append(transaction_type)
+        self.amounts.append(amount)
+        self.timestamps.append(timestamp)
+        self.descriptions.append(description)
+        self.balances.append(balance)
+    
+    def _view(self, index):
+        date = EPOCH + datetime.timedelta(seconds=self.timestamps[index])
+        return Transaction(
+            STRINGS[self.types[index]],
+            self.amounts[index],
+            date.strftime('%Y-%m-%d %H:%M:%S'),
+            STRINGS[self.descriptions[index]],
+            self.balances[index]
+        )
+    
+    def __len__(self):
+        return len(self.amounts)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._view(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('transaction index out of range')
+        return self._view(index)
+    
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._view(index)
+    
+    def __reversed__(self):
+        for index in range(len(self) - 1, -1, -1):
+            yield self._view(index)
+    
+    def net_total(self):
+        """Sum of deposits minus withdrawals, i.e. the last running balance"""
+        return self.balances[-1] if self.balances else 0
+    
+    def balance_at(self, timestamp):
+        """Balance after every transaction dated at or before timestamp"""
+        index = bisect_right(self.timestamps, timestamp)
+        return self.balances[index - 1] if index else 0
+    
+    def between(self, start, end):
+        """Transactions dated from start (inclusive) to end (exclusive)"""
+        return self[bisect_left(self.timestamps, start):bisect_left(self.timestamps, end)]
+    
+    def rows(self, start=None, end=None):
+        """Yield (type, amount, timestamp, description, balance) tuples
+        
+        Only transactions dated from start (inclusive) to end (exclusive) are
+        produced when those timestamps are given.
+        """
+        first = 0 if start is None else bisect_left(self.timestamps, start)
+        last = len(self) if end is None else bisect_left(self.timestamps, end)
+        for index in range(first, last):
+            yield (STRINGS[self.types[index]], self.amounts[index], self.timestamps[index],
+                   STRINGS[self.descriptions[index]], self.balances[index])
+    
+    def to_list(self):
+        return [transaction.to_dict() for transaction in self]
+
+class Account:
+    """Slotted account record, indexable like the JSON dict
+    
+    The history can be left on disk as (path, offset, length) of its JSON
+    array in a history file; it is read on first access to transactions.
+    """
+    __slots__ = ('owner', 'type', 'balance', 'created_at', '_transactions', '_history')
+    
+    def __init__(self, owner, account_type, balance, created_at, transactions, history=None):
+        self.owner = owner
+        self.type = account_type
+        self.balance = balance
+        self.created_at = created_at
+        self._transactions = transactions
+        self._history = history
+    
+    @classmethod
+    def from_dict(cls, account):
+        return cls(account['owner'], account['type'], account['balance'], account['created_at'],
+                   TransactionLog(account['transactions']))
+    
+    @classmethod
+    def from_header(cls, account, history_file):
+        """Build an account whose history stays in history_file until needed"""
+        offset, length = account['history']
+        return cls(account['owner'], account['type'], account['balance'], account['created_at'],
+                   None, (history_file, offset, length))
+    
+    @property
+    def transactions(self):
+        if self._transactions is None:
+            with HISTORY_LOCK:
+                if self._transactions is None:
+                    self._transactions = TransactionLog(json.loads(self._read_history()))
+                    self._history = None
+        return self._transactions
+    
+    def read_transactions(self):
+        """The transaction log, parsed without being kept if it is still on disk
+        
+        Lets a full scan visit every history without loading them all.
+        """
+        with HISTORY_LOCK:
+            if self._transactions is not None:
+                return self._transactions
+            history = self._read_history()
+        return TransactionLog(json.loads(history))
+    
+    def _read_history(self):
+        path, offset, length = self._history
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+    
+    def history_json(self):
+        """The history as JSON bytes, copied from disk if it was never loaded"""
+        if self._transactions is None:
+            return self._read_history()
+        return json.dumps(self._transactions.to_list(), separators=(',', ':')).encode()
+    
+    def header(self):
+        return {'owner': self.owner, 'type': self.type, 'balance': self.balance, 'created_at': self.created_at}
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def __setitem__(self, key, value):
+        if key not in ('owner', 'type', 'balance', 'created_at'):
+            raise KeyError(key)
+        setattr(self, key, value)
+    
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+    
+    def to_dict(self):
+        return {
+            'owner': self.owner,
+            'type': self.type,
+            'balance': self.balance,
+            'created_at': self.created_at,
+            'transactions': self.transactions.to_list()
+        }
+
+class DataManager:
+    # Operations timed when a metrics registry is given
+    INSTRUMENTED_OPERATIONS = (
+        'load_data', 'save_data', 'authenticate_user', 'add_user', 'get_user_accounts',
+        'reserve_account_ids', 'create_account', 'bulk_create', 'get_transactions', 'balance_as_of',
+        'transactions_between', 'reconcile', 'top_accounts', 'rebuild_rollups',
+        'process_transaction', 'process_batch', 'transfer', 'flush'
+    )
+    
+    def __init__(self, data_file='data/bank_data.json', journal=False, checkpoint_interval=1000,
+                 thread_safe=False, async_commit=False, max_commit_delay=0.05, lazy_history=False,
+                 metrics=None, generations=3, storage_format=None, compression=None):
+        self.DATA_FILE = data_file
+        self.JOURNAL_FILE = data_file + '.journal'
+        self.GENERATIONS_FILE = data_file + '.generations'
+        
+        # Each snapshot replaces DATA_FILE atomically; the previous ones are
+        # kept as DATA_FILE.<generation> and listed newest first, with their
+        # size and CRC-32, in GENERATIONS_FILE
+        self.generations = max(generations, 1)
+        self._generations = []
+        # Generation held by DATA_FILE, or None if it isn't a verified snapshot
+        self._data_file_generation = None
+        # Set when DATA_FILE was unreadable and an older generation was loaded
+        self.recovered_from = None
+        # (first, last) seq of changes lost when the journal didn't continue
+        # the loaded snapshot; see _replay_journal
+        self.journal_gap = None
+        
+        # 'json' or 'binary' (see snapshot_format), with compression 'none' or
+        # 'zlib' for binary; unset, saves keep the format of the loaded file.
+        # Split snapshots (lazy_history) are always JSON
+        self.storage_format = storage_format
+        self.compression = compression
+        self.journal = journal
+        
+        # With lazy_history, snapshots keep only users and account headers in
+        # DATA_FILE and the histories in a separate file read on demand
+        self.lazy_history = lazy_history
+        self.checkpoint_interval = checkpoint_interval
+        self._journal_records = 0
+        # Error of a failed write whose records are applied in memory but not
+        # on disk; see _recover_write_failure
+        self._write_failure = None
+        
+        # Balance checks and updates lock only the accounts involved; changes
+        # are applied and ordered under the single commit lock, and files are
+        # only written under the write lock. Without async_commit, applied
+        # records wait in _unwritten and whichever caller holds the flush lock
+        # writes all of them in seq order, outside the commit lock
+        self.thread_safe = thread_safe or async_commit
+        self._commit_lock = threading.RLock() if self.thread_safe else nullcontext()
+        self._create_lock = threading.Lock() if self.thread_safe else nullcontext()
+        self._write_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._unwritten = []
+        self._durable_seq = 0
+        self._account_locks = [threading.Lock() for _ in range(ACCOUNT_LOCK_STRIPES)] if self.thread_safe else []
+        
+        # Callbacks notified with (event, key) after each committed change
+        self._listeners = []
+        
+        # Ranking of the largest balances, built on first use; see top_accounts
+        self._top_accounts = None
+        self._top_floor = 0
+        
+        # Without a registry nothing is wrapped, so instrumentation costs nothing
+        self.metrics = metrics
+        if metrics is not None:
+            self._instrument(metrics)
+        
+        self.data = self.load_data()
+        self._durable_seq = self.data['meta'].get('journal_seq', 0)
+        
+        # With async_commit, changes return once applied in memory and a
+        # background writer persists each burst with one write and fsync
+        self.async_commit = async_commit
+        self.max_commit_delay = max_commit_delay
+        if async_commit:
+            self._pending = []
+            self._pending_cond = threading.Condition()
+            self._closing = False
+            self._writer = threading.Thread(target=self._writer_loop, name='bank-persistence', daemon=True)
+            self._writer.start()
+    
+    def load_data(self):
+        """Load data from JSON file or create default if file doesn't exist"""
+        if os.path.exists(self.GENERATIONS_FILE):
+            with open(self.GENERATIONS_FILE, 'r') as f:
+                self._generations = json.load(f)
+        
+        if not os.path.exists(self.DATA_FILE) and not self._generations:
+            # Create data directory if it doesn't exist
+            os.makedirs(os.path.dirname(self.DATA_FILE) or '.', exist_ok=True)
+            
+            # Create default data with admin user
+            default_data = {
+                'users': {
+                    'admin': {
+                        'password': hash_password('admin123'),
+                        'role': 'admin',
+                        'name': 'System Administrator'
+                    }
+                },
+                'accounts': {},
+                'meta': {'amount_unit': 'cents'}
+            }
+            size, crc32 = replace_file(self.DATA_FILE, self._snapshot_writer(default_data))
+            self._generations = [{'generation': 0, 'size': size, 'crc32': crc32,
+                                  'history_file': None, 'history_size': None, 'history_crc32': None}]
+            self._data_file_generation = 0
+            data = default_data
+        else:
+            # Load the newest snapshot that passes verification
+            data = self._read_snapshot()
+        
+        # Convert files written with float amounts to integer cents
+        meta = data.setdefault('meta', {})
+        if meta.get('amount_unit') != 'cents':
+            self._convert_to_cents(data)
+        
+        # Hold accounts as compact records instead of nested dicts; histories
+        # of a split snapshot stay on disk until they are used
+        history_file = os.path.join(os.path.dirname(self.DATA_FILE), meta.get('history_file', ''))
+        data['accounts'] = {
+            acc_id: acc if isinstance(acc, Account) else
+            Account.from_header(acc, history_file) if 'history' in acc else Account.from_dict(acc)
+            for acc_id, acc in data['accounts'].items()
+        }
+        
+        # Seed the account ID counter for files written before it existed
+        if 'next_account_number' not in meta:
+            meta['next_account_number'] = max(
+                (self._account_number(acc_id) for acc_id in data['accounts']), default=0) + 1
+        
+        # Rebuild secondary indexes from the snapshot
+        self._rebuild_owner_index(data)
+        
+        # Reuse the stored rollups unless the file was changed by something
+        # that doesn't maintain them
+        if not self._rollups_match_accounts(data):
+            data['rollups'] = self._compute_rollups(data['accounts'])
+        
+        # Replay mutations logged since the last checkpoint, also when this
+        # instance doesn't journal its own writes, so none are skipped
+        self._replay_journal(data)
+        return data
+    
+    def _read_snapshot(self):
+        """Parse DATA_FILE, or the newest older generation that verifies if it doesn't parse
+        
+        DATA_FILE is accepted whenever it parses, also if it doesn't match the
+        recorded size and CRC-32, e.g. after BankSystem.py or an editor saved
+        it or a crash before its generation was recorded; it then replaces the
+        generation recorded for it. Older generations are only a fallback for
+        a DATA_FILE that is torn or missing, and loading one warns. Their
+        sizes are compared before anything is read, so truncated generations
+        are skipped at the cost of a stat.
+        
+        A split snapshot also needs its history file. For DATA_FILE only the
+        size is checked, since reading every history would undo lazy loading;
+        older generations must match the history file's CRC-32 as well.
+        """
+        # A generation moves from DATA_FILE to its own name when it is superseded
+        kept = [entry for entry in self._generations
+                if os.path.exists(f"{self.DATA_FILE}.{entry['generation']}")]
+        try:
+            with open(self.DATA_FILE, 'rb') as f:
+                raw = f.read()
+            data = self._decode_snapshot(raw)
+            meta = data.get('meta', {})
+            self._check_history_file(meta.get('history_file'), meta.get('history_size'))
+        except (OSError, ValueError, struct.error, zlib.error) as e:
+            error = e
+        else:
+            size, crc32 = len(raw), zlib.crc32(raw)
+            newest = self._generations[0] if self._generations else None
+            if newest is not None and (newest['size'], newest['crc32']) == (size, crc32):
+                self._data_file_generation = newest['generation']
+                return data
+            
+            generation = max([meta.get('generation', 0)] + [entry['generation'] + 1 for entry in kept])
+            self._generations = [{'generation': generation, 'size': size, 'crc32': crc32,
+                                  'history_file': meta.get('history_file'),
+                                  'history_size': meta.get('history_size'),
+                                  'history_crc32': meta.get('history_crc32')}] + kept
+            self._data_file_generation = generation
+            return data
+        
+        for index, entry in enumerate(kept):
+            path = f"{self.DATA_FILE}.{entry['generation']}"
+            try:
+                if os.path.getsize(path) != entry['size']:
+                    continue
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                if zlib.crc32(raw) != entry['crc32']:
+                    continue
+                self._check_history_file(entry.get('history_file'), entry.get('history_size'),
+                                         entry.get('history_crc32'))
+            except (OSError, ValueError):
+                continue
+            
+            # The journal has everything since this generation unless a later
+            # checkpoint truncated it; see _replay_journal
+            self._generations = kept[index:]
+            self.recovered_from = path
+            warnings.warn(f"{self.DATA_FILE} could not be read ({error}); rolled back to {path}", RuntimeWarning)
+            return self._decode_snapshot(raw)
+        raise error
+    
+    def _check_history_file(self, history_file, size, crc32=None):
+        """Raise ValueError if a split snapshot's history file is torn or was replaced
+        
+        Only the given size and CRC-32 are compared; snapshots written before
+        they were recorded have neither. A missing file raises OSError.
+        """
+        if not history_file:
+            return
+        path = os.path.join(os.path.dirname(self.DATA_FILE), history_file)
+        actual_size = os.path.getsize(path)
+        if size is not None and actual_size != size:
+            raise ValueError(f"history file {path} has {actual_size} bytes instead of {size}")
+        if crc32 is not None:
+            actual_crc32 = 0
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    actual_crc32 = zlib.crc32(chunk, actual_crc32)
+            if actual_crc32 != crc32:
+                raise ValueError(f"history file {path} doesn't match its CRC-32")
+    
+    def _decode_snapshot(self, raw):
+        """Parse a JSON or binary snapshot, adopting its format for later saves"""
+        if not snapshot_format.is_binary_snapshot(raw):
+            self.storage_format = self.storage_format or 'json'
+            return json.loads(raw)
+        self.storage_format = self.storage_format or 'binary'
+        self.compression = self.compression or snapshot_format.compression_of(raw)
+        
+        data = {}
+        accounts = {}
+        # Snapshot string IDs -> STRINGS IDs, the identity in a fresh process
+        string_ids = array('I')
+        remap = False
+        for tag, value in snapshot_format.read_records(raw):
+            if tag == snapshot_format.HEADER:
+                data.update(value)
+            elif tag == snapshot_format.STRINGS:
+                first = len(string_ids)
+                string_ids.extend(STRINGS.intern(string) for string in value)
+                remap = remap or any(string_ids[index] != index for index in range(first, len(string_ids)))
+            else:
+                account_id, owner, account_type, balance, created_at, (types, amounts, timestamps, descriptions) = value
+                if remap:
+                    types = array('I', [string_ids[string_id] for string_id in types])
+                    descriptions = array('I', [string_ids[string_id] for string_id in descriptions])
+                accounts[account_id] = Account(owner, account_type, balance, created_at,
+                                               TransactionLog.from_columns(types, amounts, timestamps, descriptions))
+        data['accounts'] = accounts
+        return data
+    
+    def _snapshot_writer(self, data):
+        """Return a function writing data to a binary file in storage_format"""
+        if self.storage_format != 'binary':
+            return lambda f: json.dump(data, f, indent=4, default=lambda record: record.to_dict())
+        
+        def write(f):
+            writer = snapshot_format.SnapshotWriter(f, self.compression or 'none')
+            writer.write_header({key: value for key, value in data.items() if key != 'accounts'})
+            for acc_id, account in data['accounts'].items():
+                transactions = account.transactions
+                writer.write_strings(STRINGS.strings)
+                writer.write_account(acc_id, account.owner, account.type, account.balance, account.created_at,
+                                     (transactions.types, transactions.amounts,
+                                      transactions.timestamps, transactions.descriptions))
+            writer.close()
+        return write
+    
+    def _replace_snapshot(self, write, generation, history_file=None, history_size=None, history_crc32=None):
+        """Atomically replace DATA_FILE with what write(file) writes and record the new generation
+        
+        The snapshot being replaced is kept as DATA_FILE.<generation> by
+        hard-linking it before the rename, so nothing is copied. Generations
+        beyond the newest self.generations are deleted along with history
+        files no remaining generation uses. The size and CRC-32 of a split
+        snapshot's history file are recorded with its generation.
+        """
+        previous = self._data_file_generation
+        if previous is not None and self.generations > 1 and os.path.exists(self.DATA_FILE):
+            kept_path = f"{self.DATA_FILE}.{previous}"
+            if not os.path.exists(kept_path):
+                try:
+                    os.link(self.DATA_FILE, kept_path)
+                except OSError:
+                    # File systems without hard links
+                    shutil.copyfile(self.DATA_FILE, kept_path)
+        
+        size, crc32 = replace_file(self.DATA_FILE, write)
+        if self.metrics is not None:
+            self._count_bytes_written('snapshot', size)
+        self._data_file_generation = generation
+        
+        entries = [{'generation': generation, 'size': size, 'crc32': crc32, 'history_file': history_file,
+                    'history_size': history_size, 'history_crc32': history_crc32}] + self._generations
+        self._generations, dropped = entries[:self.generations], entries[self.generations:]
+        replace_file(self.GENERATIONS_FILE, lambda f: json.dump(self._generations, f, indent=4))
+        
+        in_use = {entry['history_file'] for entry in self._generations}
+        directory = os.path.dirname(self.DATA_FILE)
+        for entry in dropped:
+            paths = [f"{self.DATA_FILE}.{entry['generation']}"]
+            if entry['history_file'] and entry['history_file'] not in in_use:
+                paths.append(os.path.join(directory, entry['history_file']))
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    def _next_generation(self):
+        return max([self.data['meta'].get('generation', 0)]
+                   + [entry['generation'] for entry in self._generations]) + 1
+    
+    def save_data(self):
+        """Save data to DATA_FILE in storage_format"""
+        with self._commit_lock, self._write_lock:
+            if self.lazy_history:
+                self._save_split_snapshot()
+            else:
+                # Histories still in a split snapshot's file are read while dumping
+                for key in ('history_file', 'history_size', 'history_crc32'):
+                    self.data['meta'].pop(key, None)
+                self.data['meta']['generation'] = self._next_generation()
+                self._replace_snapshot(self._snapshot_writer(self.data), self.data['meta']['generation'])
+            
+            # The snapshot now contains every journaled mutation; the journal
+            # restarts with the seq it follows, so replay can detect a gap
+            if self.journal or os.path.exists(self.JOURNAL_FILE):
+                with open(self.JOURNAL_FILE, 'w') as f:
+                    f.write(json.dumps({'base_seq': self.data['meta'].get('journal_seq', 0)}) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._journal_records = 0
+            
+            # The snapshot covers records still waiting to be written
+            self._unwritten = []
+            self._durable_seq = self.data['meta'].get('journal_seq', 0)
+    
+    def _save_split_snapshot(self):
+        """Write histories to a new history file, then the headers to DATA_FILE
+        
+        Unloaded histories are copied as raw bytes. The header file is
+        replaced only after the new history file is on disk, so a crash
+        leaves the previous snapshot intact. Each generation has its own
+        history file, deleted when the generation is.
+        """
+        meta = self.data['meta']
+        generation = self._next_generation()
+        history_name = f"{os.path.basename(self.DATA_FILE)}.history.{generation}"
+        history_path = os.path.join(os.path.dirname(self.DATA_FILE), history_name)
+        
+        headers = {}
+        locations = {}
+        with open(history_path, 'wb') as f:
+            writer = ChecksumWriter(f)
+            for acc_id, account in self.data['accounts'].items():
+                history = account.history_json()
+                locations[acc_id] = (writer.size, len(history))
+                writer.write(history + b'\n')
+                headers[acc_id] = account.header()
+                headers[acc_id]['history'] = list(locations[acc_id])
+            f.flush()
+            os.fsync(f.fileno())
+            if self.metrics is not None:
+                self._count_bytes_written('history', writer.size)
+        
+        # Recorded in the header file too, so a copy saved elsewhere can be checked
+        history_meta = {'history_file': history_name, 'history_size': writer.size, 'history_crc32': writer.crc32}
+        snapshot = {
+            'users': self.data['users'],
+            'accounts': headers,
+            'rollups': self.data['rollups'],
+            'meta': dict(meta, generation=generation, **history_meta)
+        }
+        
+        # Point unloaded histories at the new file before older ones can be deleted
+        with HISTORY_LOCK:
+            for acc_id, account in self.data['accounts'].items():
+                if account._history is not None:
+                    account._history = (history_path, *locations[acc_id])
+        self._replace_snapshot(lambda f: json.dump(snapshot, f, indent=4), generation, **history_meta)
+        meta.update(history_meta)
+        meta['generation'] = generation
+    
+    def checkpoint(self):
+        """Write a full snapshot and truncate the journal"""
+        self.save_data()
+    
+    @staticmethod
+    def _convert_to_cents(data):
+        """Convert float balances and amounts to integer cents in place"""
+        def cents(amount):
+            return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+        
+        for account in data['accounts'].values():
+            account['balance'] = cents(account['balance'])
+            for transaction in account['transactions']:
+                transaction['amount'] = cents(transaction['amount'])
+        data['meta']['amount_unit'] = 'cents'
+    
+    @staticmethod
+    def _account_number(account_id):
+        """Numeric part of an account ID such as ACC000042"""
+        return int(account_id[3:])
+    
+    @staticmethod
+    def _format_account_id(number):
+        """Format an account number as an account ID"""
+        return f"ACC{number:06d}"
+    
+    def _rebuild_owner_index(self, data):
+        """Rebuild the owner -> account IDs index"""
+        self._owner_index = {}
+        for acc_id, acc in data['accounts'].items():
+            self._owner_index.setdefault(acc.owner, []).append(acc_id)
+    
+    def _replay_journal(self, data):
+        """Apply journal records newer than the snapshot to data
+        
+        The records must continue the snapshot's seq without a gap. There is
+        one when the snapshot is older than the checkpoint that started the
+        journal, e.g. after falling back to an older generation. The records
+        before the gap are applied; replaying the rest onto the wrong balances
+        would corrupt them, so the journal is copied to JOURNAL_FILE.unreplayed,
+        cut back to the applied records and journal_gap is set.
+        """
+        self._journal_records = 0
+        if not os.path.exists(self.JOURNAL_FILE):
+            return
+        
+        expected = data.get('meta', {}).get('journal_seq', 0) + 1
+        records = []
+        # End of the last line that continues the snapshot
+        position = valid_end = 0
+        torn = False
+        with open(self.JOURNAL_FILE, 'rb') as f:
+            for line in f:
+                position += len(line)
+                try:
+                    record = json.loads(line) if line.endswith(b'\n') else None
+                except ValueError:
+                    record = None
+                if record is None:
+                    # Torn write from a crash; nothing after it was acknowledged
+                    torn = True
+                    break
+                # The first line after a checkpoint holds the seq it follows
+                seq = record['base_seq'] + 1 if 'base_seq' in record else record['seq']
+                if seq > expected:
+                    self.journal_gap = (expected, seq - 1)
+                    break
+                if 'seq' in record and seq == expected:
+                    records.append(record)
+                    expected += 1
+                valid_end = position
+        
+        if self.journal_gap:
+            shutil.copyfile(self.JOURNAL_FILE, self.JOURNAL_FILE + '.unreplayed')
+        if self.journal_gap or torn:
+            # Later appends must directly follow the last replayed record;
+            # after a torn line they would be dropped on the next replay
+            with open(self.JOURNAL_FILE, 'r+b') as f:
+                f.truncate(valid_end)
+                os.fsync(f.fileno())
+        
+        for record in records:
+            self._apply_record(data, record)
+        self._journal_records = len(records)
+    
+    def _apply_record(self, data, record):
+        """Apply a single mutation record to data"""
+        op = record['op']
+        if op == 'add_user':
+            data['users'][record['username']] = record['user']
+        elif op == 'set_password':
+            data['users'][record['username']]['password'] = record['password']
+        elif op == 'create_account':
+            account = data['accounts'][record['account_id']] = Account.from_dict(record['account'])
+            self._owner_index.setdefault(record['account']['owner'], []).append(record['account_id'])
+            self._rollup_balance(data['rollups'], account, account.balance, new_account=True)
+            for transaction in record['account']['transactions']:
+                self._rollup_transaction(data['rollups'], transaction['type'], transaction['amount'],
+                                         transaction['date'])
+            self._update_top_accounts(record['account_id'], account.balance)
+            data['meta']['next_account_number'] = max(
+                data['meta']['next_account_number'], self._account_number(record['account_id']) + 1)
+        elif op == 'reserve_account_ids':
+            data['meta']['next_account_number'] = max(
+                data['meta']['next_account_number'], record['next_account_number'])
+        elif op == 'transaction':
+            account = data['accounts'][record['account_id']]
+            delta = {'deposit': record['amount'], 'withdraw': -record['amount']}.get(record['type'], 0)
+            # Appending checks the ranges, so the balance only changes if it succeeds
+            account.transactions.append({
+                'type': record['type'],
+                'amount': record['amount'],
+                'date': record['date'],
+                'description': record['description']
+            })
+            account.balance += delta
+            self._rollup_balance(data['rollups'], account, delta)
+            self._rollup_transaction(data['rollups'], record['type'], record['amount'], record['date'])
+            self._update_top_accounts(record['account_id'], account.balance)
+        elif op == 'transfer':
+            # Both legs are applied together so money is never in flight
+            source = data['accounts'][record['from']]
+            target = data['accounts'][record['to']]
+            if not (0 < record['amount'] <= MAX_CENTS and source.balance - record['amount'] >= -MAX_CENTS
+                    and target.balance + record['amount'] <= MAX_CENTS):
+                raise OverflowError("Amount or balance out of range")
+            source.balance -= record['amount']
+            target.balance += record['amount']
+            suffix = f" - {record['description']}" if record['description'] else ""
+            source.transactions.append({
+                'type': 'withdraw',
+                'amount': record['amount'],
+                'date': record['date'],
+                'description': f"Transfer {record['transfer_id']} to {record['to']}{suffix}"
+            })
+            target.transactions.append({
+                'type': 'deposit',
+                'amount': record['amount'],
+                'date': record['date'],
+                'description': f"Transfer {record['transfer_id']} from {record['from']}{suffix}"
+            })
+            self._rollup_balance(data['rollups'], source, -record['amount'])
+            self._rollup_balance(data['rollups'], target, record['amount'])
+            self._rollup_transaction(data['rollups'], 'withdraw', record['amount'], record['date'])
+            self._rollup_transaction(data['rollups'], 'deposit', record['amount'], record['date'])
+            self._update_top_accounts(record['from'], source.balance)
+            self._update_top_accounts(record['to'], target.balance)
+            data['meta']['next_transfer_number'] = max(
+                data['meta'].get('next_transfer_number', 1), int(record['transfer_id'][3:]) + 1)
+        elif op == 'set_meta':
+            data['meta'].update(record['values'])
+        data['meta']['journal_seq'] = record['seq']
+    
+    @staticmethod
+    def _rollup_transaction(rollups, transaction_type, amount, date):
+        """Add a transaction to the per-day totals"""
+        day = rollups['by_day'].get(date[:10])
+        if day is None:
+            day = rollups['by_day'][date[:10]] = {
+                'deposits': 0, 'deposit_count': 0, 'withdrawals': 0, 'withdrawal_count': 0}
+        if transaction_type == 'deposit':
+            day['deposits'] += amount
+            day['deposit_count'] += 1
+        elif transaction_type == 'withdraw':
+            day['withdrawals'] += amount
+            day['withdrawal_count'] += 1
+    
+    @staticmethod
+    def _rollup_balance(rollups, account, delta, new_account=False):
+        """Add a balance change to the account type and owner totals"""
+        for group, key in (('by_type', account.type), ('by_owner', account.owner)):
+            totals = rollups[group].get(key)
+            if totals is None:
+                totals = rollups[group][key] = {'accounts': 0, 'balance': 0}
+            totals['balance'] += delta
+            totals['accounts'] += new_account
+    
+    def _compute_rollups(self, accounts):
+        """Compute every rollup from scratch by scanning all histories"""
+        rollups = {'by_day': {}, 'by_type': {}, 'by_owner': {}}
+        for account in accounts.values():
+            self._rollup_balance(rollups, account, account.balance, new_account=True)
+            for transaction_type, amount, timestamp, _, _ in account.read_transactions().rows():
+                date = (EPOCH + datetime.timedelta(seconds=timestamp)).strftime('%Y-%m-%d')
+                self._rollup_transaction(rollups, transaction_type, amount, date)
+        return rollups
+    
+    def _rollups_match_accounts(self, data):
+        """Check stored rollups against the account headers, without reading histories"""
+        rollups = data.get('rollups')
+        if not rollups:
+            return False
+        expected = {'by_day': {}, 'by_type': {}, 'by_owner': {}}
+        for account in data['accounts'].values():
+            self._rollup_balance(expected, account, account.balance, new_account=True)
+        return expected['by_type'] == rollups['by_type'] and expected['by_owner'] == rollups['by_owner']
+    
+    def _update_top_accounts(self, account_id, balance):
+        """Keep the cached top-accounts ranking valid after a balance change"""
+        top = self._top_accounts
+        if top is None:
+            return
+        if account_id in top:
+            if balance < self._top_floor and len(self.data['accounts']) > len(top):
+                # An account outside the ranking may now be ahead; rebuild on next use
+                self._top_accounts = None
+                return
+            top[account_id] = balance
+        elif len(top) < TOP_ACCOUNTS_TRACKED:
+            top[account_id] = balance
+        elif balance > self._top_floor:
+            del top[min(top, key=top.get)]
+            top[account_id] = balance
+        else:
+            return
+        self._top_floor = min(top.values())
+    
+    def _account_lock(self, account_id):
+        """Get the lock guarding an account's balance, shared with other accounts"""
+        if not self.thread_safe:
+            return nullcontext()
+        return self._account_locks[hash(account_id) % ACCOUNT_LOCK_STRIPES]
+    
+    def _lock_accounts(self, account_ids):
+        """Lock several accounts' stripes once each, in order, so concurrent callers can't deadlock"""
+        stack = ExitStack()
+        if self.thread_safe:
+            for stripe in sorted({hash(account_id) % ACCOUNT_LOCK_STRIPES for account_id in account_ids}):
+                stack.enter_context(self._account_locks[stripe])
+        return stack
+    
+    def _instrument(self, metrics):
+        """Wrap operations with timers and locks with wait-time histograms"""
+        for operation in self.INSTRUMENTED_OPERATIONS:
+            setattr(self, operation, metrics.timed(
+                getattr(self, operation), 'bank_operation_seconds',
+                "Latency of DataManager operations", operation=operation))
+        
+        # Count successful and failed logins around the timed method
+        attempts = {
+            success: metrics.counter('bank_auth_attempts_total', "Authentication attempts",
+                                     result='success' if success else 'failure')
+            for success in (True, False)
+        }
+        authenticate_user = self.authenticate_user
+        
+        def counted_authenticate_user(username, password):
+            role = authenticate_user(username, password)
+            attempts[role is not None].inc()
+            return role
+        self.authenticate_user = counted_authenticate_user
+        
+        def lock_wait(lock):
+            return metrics.histogram('bank_lock_wait_seconds', "Time spent waiting for locks", lock=lock)
+        
+        if self.thread_safe:
+            self._commit_lock = TimedLock(self._commit_lock, lock_wait('commit'))
+            self._create_lock = TimedLock(self._create_lock, lock_wait('create'))
+        self._write_lock = TimedLock(self._write_lock, lock_wait('write'))
+        account_lock_wait = lock_wait('account')
+        self._account_locks = [TimedLock(lock, account_lock_wait) for lock in self._account_locks]
+        
+        self._transaction_counters = {
+            transaction_type: metrics.counter('bank_transactions_total', "Committed transactions by type",
+                                              type=transaction_type)
+            for transaction_type in ('deposit', 'withdraw', 'transfer')
+        }
+        self._bytes_written = {
+            kind: (metrics.counter('bank_bytes_written_total', "Bytes written to disk", file=kind),
+                   metrics.histogram('bank_write_bytes', "Bytes written per save or journal append",
+                                     SIZE_BUCKETS, file=kind))
+            for kind in ('snapshot', 'history', 'journal')
+        }
+        metrics.gauge('bank_users', "Number of users", lambda: len(self.data['users']))
+        metrics.gauge('bank_accounts', "Number of accounts", lambda: len(self.data['accounts']))
+        metrics.gauge('bank_journal_records', "Records in the journal since the last checkpoint",
+                      lambda: self._journal_records)
+    
+    def _count_bytes_written(self, kind, size):
+        counter, histogram = self._bytes_written[kind]
+        counter.inc(size)
+        histogram.observe(size)
+    
+    def _count_records(self, records):
+        """Count committed transactions by type"""
+        for record in records:
+            if record['op'] == 'transaction':
+                self._transaction_counters[record['type']].inc()
+            elif record['op'] == 'transfer':
+                self._transaction_counters['transfer'].inc()
+    
+    def add_listener(self, listener):
+        """Register listener(event, key) to be called after changes are committed
+        
+        Events are 'user_added' (key is the username), 'account_created' and
+        'account_updated' (key is the account ID). Listeners run on the
+        thread that made the change.
+        """
+        self._listeners.append(listener)
+    
+    def remove_listener(self, listener):
+        """Unregister a listener added with add_listener"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+    
+    @staticmethod
+    def _record_events(record):
+        """Change notifications produced by a mutation record"""
+        op = record['op']
+        if op == 'add_user':
+            return [('user_added', record['username'])]
+        if op == 'create_account':
+            return [('account_created', record['account_id'])]
+        if op == 'transaction':
+            return [('account_updated', record['account_id'])]
+        if op == 'transfer':
+            return [('account_updated', record['from']), ('account_updated', record['to'])]
+        return []
+    
+    def _notify(self, records):
+        """Tell listeners about committed records"""
+        for record in records:
+            for event, key in self._record_events(record):
+                for listener in list(self._listeners):
+                    listener(event, key)
+    
+    def _write_records(self, records):
+        """Persist already-applied records with a single write"""
+        if not self.journal:
+            self.save_data()
+            return
+        
+        # Append compact lines instead of rewriting the whole book
+        lines = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+        with self._write_lock:
+            with open(self.JOURNAL_FILE, 'a') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            if self.metrics is not None:
+                # json.dumps escapes non-ASCII, so characters are bytes
+                self._count_bytes_written('journal', len(lines))
+            self._journal_records += len(records)
+            due = self._journal_records >= self.checkpoint_interval
+        
+        if due:
+            self.checkpoint()
+    
+    def _commit(self, *records):
+        """Apply mutation records and make them durable in a single write
+        
+        Returns a Future that resolves once the records are on disk; without
+        async_commit it is already resolved.
+        """
+        future = Future()
+        with self._commit_lock:
+            if self._write_failure is not None:
+                self._recover_write_failure()
+            for record in records:
+                record['seq'] = self.data['meta'].get('journal_seq', 0) + 1
+                if record['op'] == 'transfer' and 'transfer_id' not in record:
+                    record['transfer_id'] = f"TRF{self.data['meta'].get('next_transfer_number', 1):06d}"
+                self._apply_record(self.data, record)
+            
+            if self.async_commit:
+                # Queued in seq order; the writer thread persists the group
+                with self._pending_cond:
+                    self._pending.append((records, future))
+                    self._pending_cond.notify()
+            else:
+                self._unwritten.extend(records)
+        
+        if records and not self.async_commit:
+            self._write_through(records[-1]['seq'])
+            future.set_result(None)
+        
+        if self.metrics is not None:
+            self._count_records(records)
+        if self._listeners:
+            self._notify(records)
+        return future
+    
+    def _write_through(self, seq):
+        """Write the applied records up to at least seq, in seq order
+        
+        Runs outside the commit lock so other changes are applied meanwhile;
+        the caller holding the flush lock writes everything applied so far,
+        so concurrent commits share one write and fsync. If that write fails,
+        every caller whose records it held gets the error.
+        """
+        with self._flush_lock:
+            if self._durable_seq >= seq:
+                return
+            if self._write_failure is not None:
+                raise self._write_failure
+            
+            with self._commit_lock:
+                group, self._unwritten = self._unwritten, []
+            try:
+                self._write_records(group)
+            except Exception as e:
+                self._write_failure = e
+                raise
+            self._durable_seq = max(self._durable_seq, group[-1]['seq'])
+    
+    def _recover_write_failure(self):
+        """Write a snapshot after a failed write, before accepting more changes
+        
+        The failed records stay applied in memory with their seqs used, so
+        journaling later records after them would leave a gap that makes
+        replay set the rest aside. The snapshot includes them and restarts
+        the journal; if it fails too, its error is raised and nothing new is
+        applied.
+        """
+        with self._commit_lock:
+            if self._write_failure is not None:
+                self.checkpoint()
+                self._write_failure = None
+    
+    def _writer_loop(self):
+        """Background writer: persist queued records in groups (group commit)"""
+        while True:
+            with self._pending_cond:
+                while not self._pending and not self._closing:
+                    self._pending_cond.wait()
+                if not self._pending:
+                    return
+            
+            # Let the rest of a burst arrive, bounded by max_commit_delay
+            if not self._closing:
+                time.sleep(self.max_commit_delay)
+            
+            with self._pending_cond:
+                group, self._pending = self._pending, []
+            records = [record for pending_records, _ in group for record in pending_records]
+            try:
+                if self._write_failure is not None:
+                    # The snapshot also covers this group
+                    self._recover_write_failure()
+                elif records:
+                    self._write_records(records)
+            except Exception as e:
+                self._write_failure = self._write_failure or e
+                for _, future in group:
+                    future.set_exception(e)
+            else:
+                for _, future in group:
+                    future.set_result(None)
+    
+    def flush(self, wait=True):
+        """Make every change committed so far durable
+        
+        Returns a Future for the pending writes, after waiting for it unless
+        wait is False.
+        """
+        if not self.async_commit or self._closing:
+            future = Future()
+            future.set_result(None)
+            return future
+        
+        future = self._commit()
+        if wait:
+            future.result()
+        return future
+    
+    def close(self):
+        """Flush pending writes and stop the background writer"""
+        if self.async_commit and not self._closing:
+            with self._pending_cond:
+                self._closing = True
+                self._pending_cond.notify()
+            self._writer.join()
+    
+    def authenticate_user(self, username, password):
+        """Authenticate a user and return their role if successful"""
+        if not username or not password:
+            return None
+        
+        # Unknown usernames are checked against a dummy hash, so the time
+        # taken doesn't tell which users exist
+        user = self.data['users'].get(username)
+        matches, new_hash = check_password(password, user['password'] if user else None)
+        if not matches:
+            return None
+        
+        # Upgrade legacy and weaker hashes while the password is at hand
+        if new_hash:
+            with self._create_lock:
+                self._commit({'op': 'set_password', 'username': username, 'password': new_hash})
+        return user['role']
+    
+    def get_user_data(self, username):
+        """Get user data by username"""
+        return self.data['users'].get(username)
+    
+    def get_users(self):
+        """Get all users"""
+        return self.data['users']
+    
+    def add_user(self, username, password, name, role):
+        """Add a new user"""
+        if username in self.data['users']:
+            return False, "Username already exists"
+        
+        # Hash before taking the lock; the KDF is deliberately slow
+        password_hash = hash_password(password)
+        with self._create_lock:
+            if username in self.data['users']:
+                return False, "Username already exists"
+            
+            self._commit({
+                'op': 'add_user',
+                'username': username,
+                'user': {
+                    'password': password_hash,
+                    'role': role,
+                    'name': name
+                }
+            })
+        return True, f"User {username} created successfully"
+    
+    def get_accounts(self):
+        """Get all accounts"""
+        return self.data['accounts']
+    
+    def get_meta(self, key, default=None):
+        """Get a value from the file's meta section"""
+        return self.data['meta'].get(key, default)
+    
+    def set_meta(self, values):
+        """Set values in the file's meta section with a single commit"""
+        self._commit({'op': 'set_meta', 'values': dict(values)})
+    
+    def get_user_accounts(self, username):
+        """Get accounts belonging to a specific user"""
+        return {acc_id: self.data['accounts'][acc_id]
+                for acc_id in self._owner_index.get(username, [])}
+    
+    def reserve_account_ids(self, count):
+        """Reserve a block of account IDs, e.g. for a bulk loader or worker
+        
+        The reservation is persisted, so the IDs are never handed out again
+        even if some of them end up unused.
+        """
+        with self._create_lock:
+            start = self.data['meta']['next_account_number']
+            self._commit({
+                'op': 'reserve_account_ids',
+                'next_account_number': start + count
+            })
+        return [self._format_account_id(number) for number in range(start, start + count)]
+    
+    def create_account(self, owner, account_type, initial_balance, account_id=None):
+        """Create a new account, optionally using a pre-reserved account ID
+        
+        initial_balance is in cents. Raises ValueError if the owner doesn't
+        exist or the balance is out of range.
+        """
+        if owner not in self.data['users']:
+            raise ValueError(f"Unknown account owner: {owner}")
+        return self._create_account(owner, account_type, initial_balance, account_id)
+    
+    def _create_account(self, owner, account_type, initial_balance, account_id=None):
+        """create_account without the owner check, for shards whose users live elsewhere"""
+        if not isinstance(initial_balance, int) or not 0 <= initial_balance <= MAX_CENTS:
+            raise ValueError("Initial balance must be integer cents between 0 and 2**63 - 1")
+        
+        with self._create_lock:
+            if account_id is None:
+                account_id = self._format_account_id(self.data['meta']['next_account_number'])
+            elif account_id in self.data['accounts']:
+                raise ValueError(f"Account {account_id} already exists")
+            
+            self._commit({
+                'op': 'create_account',
+                'account_id': account_id,
+                'account': {
+                    'owner': owner,
+                    'type': account_type,
+                    'balance': initial_balance,
+                    'created_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'transactions': [
+                        {
+                            'type': 'deposit',
+                            'amount': initial_balance,
+                            'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                            'description': 'Initial deposit'
+                        }
+                    ]
+                }
+            })
+        return account_id
+    
+    def bulk_create(self, users, accounts):
+        """Add many users and accounts with a single commit
+        
+        users maps usernames to user dicts with already hashed passwords.
+        accounts are account dicts in the JSON layout (amounts in cents) and
+        get consecutive new IDs, which are returned in the same order.
+        Raises ValueError, without changing anything, if a username is taken
+        or an account's owner doesn't exist.
+        """
+        with self._create_lock:
+            taken = [username for username in users if username in self.data['users']]
+            if taken:
+                raise ValueError(f"Usernames already exist: {', '.join(taken[:10])}")
+            unknown = {account['owner'] for account in accounts
+                       if account['owner'] not in users and account['owner'] not in self.data['users']}
+            if unknown:
+                raise ValueError(f"Unknown account owners: {', '.join(sorted(unknown)[:10])}")
+            # Reject out-of-range amounts before any record is applied
+            for account in accounts:
+                try:
+                    TransactionLog(account['transactions'])
+                except OverflowError:
+                    raise ValueError(f"Account of {account['owner']} has an amount or balance out of range") from None
+                if not 0 <= account['balance'] <= MAX_CENTS:
+                    raise ValueError(f"Account of {account['owner']} has a balance out of range")
+            
+            start = self.data['meta']['next_account_number']
+            account_ids = [self._format_account_id(number) for number in range(start, start + len(accounts))]
+            self._commit(
+                *({'op': 'add_user', 'username': username, 'user': user} for username, user in users.items()),
+                *({'op': 'create_account', 'account_id': account_id, 'account': account}
+                  for account_id, account in zip(account_ids, accounts))
+            )
+        return account_ids
+    
+    def get_account(self, account_id):
+        """Get account by ID"""
+        return self.data['accounts'].get(account_id)
+    
+    def reconcile(self):
+        """Return IDs of accounts whose balance doesn't match their history
+        
+        Amounts are integer cents, so the running balances are exact.
+        """
+        return [account_id for account_id, account in self.data['accounts'].items()
+                if account.transactions.net_total() != account.balance]
+    
+    def get_transaction_count(self, account_id):
+        """Get the number of transactions recorded for an account"""
+        account = self.data['accounts'].get(account_id)
+        return len(account.transactions) if account else 0
+    
+    def get_transactions(self, account_id, offset=0, limit=None, newest_first=True):
+        """Get a page of an account's transactions
+        
+        offset and limit count from the newest transaction when newest_first
+        is set, otherwise from the oldest one.
+        """
+        account = self.data['accounts'].get(account_id)
+        if not account:
+            return []
+        
+        transactions = account.transactions
+        if not newest_first:
+            return transactions[offset:None if limit is None else offset + limit]
+        
+        end = len(transactions) - offset
+        start = 0 if limit is None else max(end - limit, 0)
+        return transactions[start:end][::-1] if end > 0 else []
+    
+    def balance_as_of(self, account_id, when):
+        """Get an account's balance (cents) as of a datetime or date string
+        
+        Transactions dated exactly at when are included. Returns None for an
+        unknown account.
+        """
+        account = self.data['accounts'].get(account_id)
+        if not account:
+            return None
+        return account.transactions.balance_at(to_timestamp(when))
+    
+    def transactions_between(self, account_id, start, end):
+        """Get an account's transactions dated from start up to, not including, end
+        
+        start and end are datetimes or date strings; the transactions are
+        returned oldest first, each carrying its running balance.
+        """
+        account = self.data['accounts'].get(account_id)
+        if not account:
+            return []
+        return account.transactions.between(to_timestamp(start), to_timestamp(end))
+    
+    def get_daily_totals(self, day):
+        """Get deposit and withdrawal totals (cents) and counts for a 'YYYY-MM-DD' day"""
+        totals = self.data['rollups']['by_day'].get(day)
+        if totals is None:
+            return {'deposits': 0, 'deposit_count': 0, 'withdrawals': 0, 'withdrawal_count': 0}
+        return dict(totals)
+    
+    def get_balance_by_type(self):
+        """Get {account type: {'accounts': count, 'balance': cents}}"""
+        return {account_type: dict(totals) for account_type, totals in self.data['rollups']['by_type'].items()}
+    
+    def get_owner_totals(self, username):
+        """Get the number of accounts and total balance (cents) of an owner"""
+        return dict(self.data['rollups']['by_owner'].get(username, {'accounts': 0, 'balance': 0}))
+    
+    def top_accounts(self, limit=10):
+        """Get the (account_id, balance) pairs with the largest balances, largest first
+        
+        The ranking is maintained as balances change and only rebuilt when an
+        account drops out of it.
+        """
+        with self._commit_lock:
+            if limit > TOP_ACCOUNTS_TRACKED:
+                ranked = heapq.nlargest(limit, ((account.balance, account_id)
+                                                for account_id, account in self.data['accounts'].items()))
+                return [(account_id, balance) for balance, account_id in ranked]
+            
+            if self._top_accounts is None:
+                ranked = heapq.nlargest(TOP_ACCOUNTS_TRACKED, ((account.balance, account_id)
+                                                               for account_id, account in self.data['accounts'].items()))
+                self._top_accounts = {account_id: balance for balance, account_id in ranked}
+                self._top_floor = ranked[-1][0] if ranked else 0
+            ranked = sorted(self._top_accounts.items(), key=lambda item: (item[1], item[0]), reverse=True)
+            return ranked[:limit]
+    
+    def rebuild_rollups(self):
+        """Recompute the rollups from every history and replace the maintained ones
+        
+        Returns whether the maintained rollups matched the recomputed ones.
+        """
+        with self._commit_lock:
+            rollups = self._compute_rollups(self.data['accounts'])
+            matched = rollups == self.data['rollups']
+            self.data['rollups'] = rollups
+            self._top_accounts = None
+        return matched
+    
+    def _check_transaction(self, transaction_type, amount, balance):
+        """Return an error message if the transaction can't be applied, else None"""
+        if transaction_type not in ('deposit', 'withdraw'):
+            return "Invalid transaction type"
+        
+        if not isinstance(amount, int):
+            return "Amount must be given in integer cents"
+        
+        if amount <= 0:
+            return "Amount must be greater than zero"
+        
+        if amount > MAX_CENTS:
+            return "Amount is too large"
+        
+        if balance is None:
+            return "Account not found"
+        
+        if transaction_type == 'withdraw' and amount > balance:
+            return "Insufficient funds"
+        
+        if transaction_type == 'deposit' and balance + amount > MAX_CENTS:
+            return "Resulting balance is too large"
+        return None
+    
+    def _now(self, *account_ids):
+        """The current time as a date string, but not before the accounts' last transactions
+        
+        Histories double as sorted indexes for point-in-time queries (see
+        TransactionLog), so a local clock going back, e.g. when daylight
+        saving time ends, must not date a transaction before an earlier one.
+        """
+        timestamp = to_timestamp(datetime.datetime.now())
+        for account_id in account_ids:
+            account = self.data['accounts'].get(account_id)
+            if account is not None and account.transactions.timestamps:
+                timestamp = max(timestamp, account.transactions.timestamps[-1])
+        return (EPOCH + datetime.timedelta(seconds=timestamp)).strftime('%Y-%m-%d %H:%M:%S')
+    
+    def _transaction_record(self, account_id, transaction_type, amount, description, date):
+        """Build the mutation record for a deposit or withdrawal"""
+        return {
+            'op': 'transaction',
+            'account_id': account_id,
+            'type': transaction_type,
+            'amount': amount,
+            'date': date,
+            'description': description if description else f"{transaction_type.capitalize()} transaction"
+        }
+    
+    def process_transaction(self, account_id, transaction_type, amount, description):
+        """Process a transaction (deposit or withdrawal); amount is in cents"""
+        with self._account_lock(account_id):
+            account = self.data['accounts'].get(account_id)
+            error = self._check_transaction(transaction_type, amount, account.balance if account else None)
+            if error:
+                return False, error
+            
+            # Record the transaction and update the balance
+            self._commit(self._transaction_record(account_id, transaction_type, amount, description,
+                                                  self._now(account_id)))
+        return True, "Transaction completed successfully"
+    
+    def process_batch(self, transactions, atomic=False, meta=None):
+        """Process many (account_id, type, amount, description) transactions
+        
+        Items are validated in order against the running balances and the
+        accepted ones are persisted with a single commit, together with the
+        meta values given, if any. Returns a list of (success, message)
+        tuples, one per item. With atomic=True nothing is applied unless
+        every item is valid.
+        """
+        transactions = list(transactions)
+        balances = {}
+        records = []
+        results = []
+        with self._lock_accounts(account_id for account_id, _, _, _ in transactions):
+            # One date for the whole batch, after every history it touches
+            date = self._now(*{account_id for account_id, _, _, _ in transactions})
+            for account_id, transaction_type, amount, description in transactions:
+                if account_id not in balances:
+                    account = self.data['accounts'].get(account_id)
+                    balances[account_id] = account.balance if account else None
+                
+                error = self._check_transaction(transaction_type, amount, balances[account_id])
+                if error:
+                    results.append((False, error))
+                    continue
+                
+                balances[account_id] += amount if transaction_type == 'deposit' else -amount
+                records.append(self._transaction_record(account_id, transaction_type, amount, description, date))
+                results.append((True, "Transaction completed successfully"))
+            
+            if atomic and len(records) != len(results):
+                return [(False, "Batch rolled back") if success else (success, message)
+                        for success, message in results]
+            
+            if meta:
+                records.append({'op': 'set_meta', 'values': meta})
+            if records:
+                self._commit(*records)
+        return results
+    
+    def transfer(self, source_id, target_id, amount, description=''):
+        """Move amount (cents) between two accounts in a single commit
+        
+        The source gets a withdrawal and the target a deposit, both tagged
+        with the same transfer ID.
+        """
+        if source_id == target_id:
+            return False, "Cannot transfer to the same account"
+        
+        with self._lock_accounts((source_id, target_id)):
+            source = self.data['accounts'].get(source_id)
+            error = self._check_transaction('withdraw', amount, source.balance if source else None)
+            if error:
+                return False, error
+            
+            target = self.data['accounts'].get(target_id)
+            if target is None:
+                return False, "Target account not found"
+            
+            if target.balance + amount > MAX_CENTS:
+                return False, "Resulting balance is too large"
+            
+            # _commit numbers the transfer under the commit lock
+            record = {
+                'op': 'transfer',
+                'from': source_id,
+                'to': target_id,
+                'amount': amount,
+                'date': self._now(source_id, target_id),
+                'description': description
+            }
+            self._commit(record)
+        return True, f"Transfer {record['transfer_id']} completed successfully"
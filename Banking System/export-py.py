@@ -0,0 +1,174 @@
+import sys
+import csv
+import json
+import struct
+import argparse
+import datetime
+from array import array
+
+from data_manager import DataManager, EPOCH, to_timestamp
+
+# Fields of an exported row; amounts and balances are integer cents and
+# dates are seconds since EPOCH until a text writer formats them
+COLUMNS = ('account_id', 'owner', 'account_type', 'type', 'amount', 'date', 'description', 'balance')
+INT_COLUMNS = frozenset(('amount', 'date', 'balance'))
+
+COLUMNAR_MAGIC = b'BANKCOL1'
+
+# Rows buffered per columnar row group; bounds the writer's memory
+ROW_GROUP_SIZE = 65536
+
+def iter_ledger(data_manager, owner=None, account_type=None, account_ids=None, start=None, end=None):
+    """Yield one row tuple in COLUMNS order per transaction matching the filters
+    
+    start and end are datetimes or date strings; a transaction matches
+    from start (inclusive) to end (exclusive). Histories still on disk are
+    parsed one account at a time and dropped afterwards, so memory use
+    doesn't grow with the size of the ledger.
+    """
+    accounts = data_manager.get_user_accounts(owner) if owner is not None else data_manager.get_accounts()
+    start = None if start is None else to_timestamp(start)
+    end = None if end is None else to_timestamp(end)
+    
+    for acc_id in list(accounts) if account_ids is None else account_ids:
+        account = accounts.get(acc_id)
+        if account is None or (account_type is not None and account.type != account_type):
+            continue
+        for transaction_type, amount, timestamp, description, balance in \
+                account.read_transactions().rows(start, end):
+            yield (acc_id, account.owner, account.type, transaction_type, amount, timestamp, description, balance)
+
+def format_timestamp(timestamp):
+    return (EPOCH + datetime.timedelta(seconds=timestamp)).strftime('%Y-%m-%d %H:%M:%S')
+
+def _with_date(row):
+    return row[:5] + (format_timestamp(row[5]),) + row[6:]
+
+def write_csv(rows, f):
+    """Write rows as CSV with a header line; returns the number of rows"""
+    writer = csv.writer(f)
+    writer.writerow(COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(_with_date(row))
+        count += 1
+    return count
+
+def write_jsonl(rows, f):
+    """Write rows as one JSON object per line; returns the number of rows"""
+    count = 0
+    for row in rows:
+        f.write(json.dumps(dict(zip(COLUMNS, _with_date(row))), separators=(',', ':')) + '\n')
+        count += 1
+    return count
+
+def write_columnar(rows, f):
+    """Write rows to a binary file in column-major row groups
+    
+    Each group is a length-prefixed JSON header followed by one block per
+    column: int64 values, or uint32 IDs into a per-group dictionary for
+    string columns. Returns the number of rows.
+    """
+    f.write(COLUMNAR_MAGIC)
+    columns = [[] for _ in COLUMNS]
+    count = 0
+    for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
+        count += 1
+        if len(columns[0]) == ROW_GROUP_SIZE:
+            _write_row_group(f, columns)
+            columns = [[] for _ in COLUMNS]
+    if columns[0]:
+        _write_row_group(f, columns)
+    return count
+
+def _write_row_group(f, columns):
+    header = {'rows': len(columns[0]), 'columns': []}
+    blocks = []
+    for name, values in zip(COLUMNS, columns):
+        if name in INT_COLUMNS:
+            entry = {'name': name, 'encoding': 'int64'}
+            block = array('q', values)
+        else:
+            dictionary = {}
+            block = array('I', [dictionary.setdefault(value, len(dictionary)) for value in values])
+            entry = {'name': name, 'encoding': 'dictionary', 'dictionary': list(dictionary)}
+        # Blocks are little-endian on disk
+        if sys.byteorder == 'big':
+            block.byteswap()
+        blocks.append(block.tobytes())
+        entry['size'] = len(blocks[-1])
+        header['columns'].append(entry)
+    
+    header = json.dumps(header, separators=(',', ':')).encode()
+    f.write(struct.pack('<I', len(header)))
+    f.write(header)
+    for block in blocks:
+        f.write(block)
+
+def read_columnar(f):
+    """Yield row tuples in COLUMNS order from a file written by write_columnar"""
+    if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar ledger export")
+    
+    while True:
+        prefix = f.read(4)
+        if not prefix:
+            return
+        header = json.loads(f.read(struct.unpack('<I', prefix)[0]))
+        columns = []
+        for entry in header['columns']:
+            block = array('q' if entry['encoding'] == 'int64' else 'I')
+            block.frombytes(f.read(entry['size']))
+            if sys.byteorder == 'big':
+                block.byteswap()
+            if entry['encoding'] == 'dictionary':
+                dictionary = entry['dictionary']
+                columns.append([dictionary[string_id] for string_id in block])
+            else:
+                columns.append(block)
+        yield from zip(*columns)
+
+# format -> (writer, file mode)
+WRITERS = {
+    'csv': (write_csv, 'w'),
+    'jsonl': (write_jsonl, 'w'),
+    'columnar': (write_columnar, 'wb')
+}
+
+def export(data_manager, path, file_format='csv', **filters):
+    """Stream the transactions matching filters (see iter_ledger) to path
+    
+    A statement is an export filtered to one account, e.g.
+    account_ids=['ACC000001'] with a start and end date. Returns the number
+    of rows written.
+    """
+    writer, mode = WRITERS[file_format]
+    if path == '-':
+        if mode == 'wb':
+            return writer(iter_ledger(data_manager, **filters), sys.stdout.buffer)
+        return writer(iter_ledger(data_manager, **filters), sys.stdout)
+    with open(path, mode, **({'newline': ''} if mode == 'w' else {})) as f:
+        return writer(iter_ledger(data_manager, **filters), f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export statements or the full ledger")
+    parser.add_argument('output', help="output file, or - for stdout")
+    parser.add_argument('--data-file', default='data/bank_data.json')
+    parser.add_argument('--format', choices=sorted(WRITERS), default='csv')
+    parser.add_argument('--owner')
+    parser.add_argument('--account-type', choices=('checking', 'savings', 'investment'))
+    parser.add_argument('--account', action='append', dest='account_ids', help="repeat to export several accounts")
+    parser.add_argument('--start', help="first date to include, e.g. 2024-03-01")
+    parser.add_argument('--end', help="first date to exclude")
+    parser.add_argument('--lazy-history', action='store_true', help="read histories of a split snapshot on demand")
+    args = parser.parse_args()
+    
+    data_manager = DataManager(args.data_file, journal=True, lazy_history=args.lazy_history)
+    count = export(data_manager, args.output, args.format, owner=args.owner, account_type=args.account_type,
+                   account_ids=args.account_ids, start=args.start, end=args.end)
+    print(f"Exported {count} transactions", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import datetime
+
+from data_manager import DataManager
+from money import format_money
+
+# Per account type: annual interest rate in basis points, the fee charged
+# each period and the balance at or above which the fee is waived (cents)
+PRODUCT_RULES = {
+    'checking': {'annual_rate_bp': 0, 'period_fee': 500, 'fee_waiver_balance': 150000},
+    'savings': {'annual_rate_bp': 200, 'period_fee': 0, 'fee_waiver_balance': 0},
+    'investment': {'annual_rate_bp': 450, 'period_fee': 1000, 'fee_waiver_balance': 1000000}
+}
+
+def compute_postings(accounts, rules=PRODUCT_RULES, periods_per_year=12):
+    """Compute one period's interest and fees for every account
+    
+    Each rule's rate, fee and descriptions are worked out once per account
+    type, then a single pass over the accounts applies them. Interest is
+    rounded half up to the cent and fees never take a balance below zero.
+    Returns (account_id, type, amount, description) postings for
+    process_batch.
+    """
+    denominator = 10000 * periods_per_year
+    prepared = {}
+    for account_type, rule in rules.items():
+        if rule:
+            rate = rule['annual_rate_bp']
+            prepared[account_type] = (rate, rule['period_fee'], rule['fee_waiver_balance'],
+                                      f"Interest ({rate / 100:.2f}% APR)",
+                                      f"{account_type.capitalize()} account fee")
+    
+    postings = []
+    for acc_id, acc in accounts.items():
+        rule = prepared.get(acc['type'])
+        if rule is None:
+            continue
+        
+        rate, fee, waiver, interest_description, fee_description = rule
+        balance = acc['balance']
+        credit = (balance * rate + denominator // 2) // denominator if balance > 0 else 0
+        charge = 0 if balance >= waiver else min(fee, max(balance + credit, 0))
+        if credit:
+            postings.append((acc_id, 'deposit', credit, interest_description))
+        if charge:
+            postings.append((acc_id, 'withdraw', charge, fee_description))
+    return postings
+
+def current_period():
+    """The current monthly period, e.g. '2024-03'"""
+    return datetime.date.today().strftime('%Y-%m')
+
+def run_period_end(data_manager, period=None, rules=PRODUCT_RULES, periods_per_year=12):
+    """Post one period's interest and fees to every account in a single commit
+    
+    period labels the period being closed (default: the current month) and
+    is recorded as last_interest_period in the same commit. Labels must
+    sort in time order, e.g. '2024-03' or '2024-Q1'; a period at or before
+    the last one posted raises ValueError. Returns a summary with the totals
+    posted and the postings that were rejected, e.g. because a concurrent
+    withdrawal emptied the account.
+    """
+    period = period or current_period()
+    last_period = data_manager.get_meta('last_interest_period')
+    if last_period is not None and period <= last_period:
+        raise ValueError(f"Interest and fees were already posted for period {last_period}")
+    
+    postings = compute_postings(data_manager.get_accounts(), rules, periods_per_year)
+    results = data_manager.process_batch(postings, meta={'last_interest_period': period})
+    
+    summary = {'interest': 0, 'fees': 0, 'postings': 0, 'rejected': []}
+    for (acc_id, transaction_type, amount, _), (success, message) in zip(postings, results):
+        if not success:
+            summary['rejected'].append((acc_id, transaction_type, amount, message))
+            continue
+        summary['postings'] += 1
+        summary['interest' if transaction_type == 'deposit' else 'fees'] += amount
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Post period-end interest and fees to every account")
+    parser.add_argument('--data-file', default='data/bank_data.json')
+    parser.add_argument('--periods-per-year', type=int, default=12)
+    parser.add_argument('--period', help="label of the period to close (default: the current month, e.g. 2024-03)")
+    parser.add_argument('--dry-run', action='store_true', help="only print what would be posted")
+    args = parser.parse_args()
+    
+    data_manager = DataManager(args.data_file, journal=True)
+    period = args.period or current_period()
+    last_period = data_manager.get_meta('last_interest_period')
+    if last_period is not None and period <= last_period:
+        parser.error(f"interest and fees were already posted for period {last_period}")
+    
+    if args.dry_run:
+        postings = compute_postings(data_manager.get_accounts(), periods_per_year=args.periods_per_year)
+        interest = sum(amount for _, transaction_type, amount, _ in postings if transaction_type == 'deposit')
+        fees = sum(amount for _, transaction_type, amount, _ in postings if transaction_type == 'withdraw')
+        print(f"{len(postings)} postings: {format_money(interest)} interest, {format_money(fees)} fees")
+        return
+    
+    summary = run_period_end(data_manager, period, periods_per_year=args.periods_per_year)
+    data_manager.checkpoint()
+    print(f"{summary['postings']} postings: {format_money(summary['interest'])} interest, "
+          f"{format_money(summary['fees'])} fees, {len(summary['rejected'])} rejected")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import time
+import bisect
+import functools
+import threading
+
+# Histogram upper bounds in seconds, from 10us to 10s
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Histogram upper bounds in bytes, from 256B to 1GiB
+SIZE_BUCKETS = tuple(256 * 4 ** n for n in range(12))
+
+class Counter:
+    """Monotonically increasing value"""
+    __slots__ = ('value', '_lock')
+    
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+class Gauge:
+    """Value that is set directly or read from a function when collected"""
+    __slots__ = ('_value', 'function')
+    
+    def __init__(self, function=None):
+        self._value = 0
+        self.function = function
+    
+    def set(self, value):
+        self._value = value
+    
+    @property
+    def value(self):
+        return self.function() if self.function else self._value
+
+class Histogram:
+    """Distribution of observed values over fixed buckets"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One count per bucket plus the overflow bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+    
+    def quantile(self, fraction):
+        """Estimate a quantile as the upper bound of the bucket it falls in"""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+class TimedLock:
+    """Lock wrapper that records how long each acquisition waited"""
+    __slots__ = ('lock', 'histogram')
+    
+    def __init__(self, lock, histogram):
+        self.lock = lock
+        self.histogram = histogram
+    
+    def __enter__(self):
+        start = time.perf_counter()
+        self.lock.acquire()
+        self.histogram.observe(time.perf_counter() - start)
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+class MetricsRegistry:
+    """In-process registry of labelled counters, gauges and histograms
+    
+    Metrics are created on first use and returned from then on, so callers
+    can look them up once and keep the object for the hot path.
+    """
+    
+    def __init__(self):
+        # name -> (kind, help text, {labels: metric})
+        self._families = {}
+        self._lock = threading.Lock()
+    
+    def _metric(self, kind, factory, name, help_text, labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help_text, {}))
+            if family[0] != kind:
+                raise ValueError(f"Metric {name} is already registered as a {family[0]}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+        return metric
+    
+    def counter(self, name, help_text='', **labels):
+        return self._metric('counter', Counter, name, help_text, labels)
+    
+    def gauge(self, name, help_text='', function=None, **labels):
+        return self._metric('gauge', lambda: Gauge(function), name, help_text, labels)
+    
+    def histogram(self, name, help_text='', buckets=LATENCY_BUCKETS, **labels):
+        return self._metric('histogram', lambda: Histogram(buckets), name, help_text, labels)
+    
+    def timed(self, function, name, help_text='', **labels):
+        """Wrap function so each call's duration is observed in a histogram"""
+        histogram = self.histogram(name, help_text, **labels)
+        
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    
+    def snapshot(self):
+        """Current values as {name: [(labels, value)]}; histograms give a dict"""
+        with self._lock:
+            families = {name: (kind, dict(metrics)) for name, (kind, _, metrics) in self._families.items()}
+        
+        result = {}
+        for name, (kind, metrics) in families.items():
+            result[name] = []
+            for labels, metric in metrics.items():
+                if kind == 'histogram':
+                    value = {
+                        'count': metric.count,
+                        'sum': metric.sum,
+                        'p50': metric.quantile(0.5),
+                        'p99': metric.quantile(0.99)
+                    }
+                else:
+                    value = metric.value
+                result[name].append((dict(labels), value))
+        return result
+    
+    def exposition(self):
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            families = [(name, kind, help_text, dict(metrics))
+                        for name, (kind, help_text, metrics) in sorted(self._families.items())]
+        
+        lines = []
+        for name, kind, help_text, metrics in families:
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in sorted(metrics.items()):
+                if kind != 'histogram':
+                    lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+                    continue
+                
+                cumulative = 0
+                for bound, count in zip(metric.buckets + ('+Inf',), metric.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {metric.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {metric.count}")
+        return '\n'.join(lines) + '\n'
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
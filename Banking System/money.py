@@ -0,0 +1,10 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+def to_cents(amount):
+    """Convert a currency amount (float, str or Decimal) to integer cents"""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def format_money(cents):
+    """Format integer cents for display, e.g. -1234 -> -$12.34"""
+    sign = '-' if cents < 0 else ''
+    return f"{sign}${abs(cents) // 100}.{abs(cents) % 100:02d}"
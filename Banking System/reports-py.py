@@ -0,0 +1,47 @@
+import sys
+import argparse
+import datetime
+
+from data_manager import DataManager
+from money import format_money
+
+def print_report(data_manager, day=None, owner=None, top=10):
+    """Print the KPI report from the maintained rollups; no history is read"""
+    day = day or datetime.date.today().isoformat()
+    totals = data_manager.get_daily_totals(day)
+    print(f"{day}: {totals['deposit_count']} deposits ({format_money(totals['deposits'])}), "
+          f"{totals['withdrawal_count']} withdrawals ({format_money(totals['withdrawals'])})")
+    
+    print("Balance by account type:")
+    for account_type, summary in sorted(data_manager.get_balance_by_type().items()):
+        print(f"  {account_type:<12} {summary['accounts']:>8} accounts {format_money(summary['balance']):>18}")
+    
+    if owner:
+        summary = data_manager.get_owner_totals(owner)
+        print(f"{owner}: {summary['accounts']} accounts, {format_money(summary['balance'])}")
+    
+    print(f"Top {top} accounts:")
+    for account_id, balance in data_manager.top_accounts(top):
+        print(f"  {account_id} {format_money(balance):>18}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Show daily, account type, owner and top-account totals")
+    parser.add_argument('--data-file', default='data/bank_data.json')
+    parser.add_argument('--day', help="day to show, e.g. 2024-03-01 (default: today)")
+    parser.add_argument('--owner', help="also show the totals of this user")
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--rebuild', action='store_true',
+                        help="recompute the rollups from every history and save them")
+    parser.add_argument('--lazy-history', action='store_true', help="read histories of a split snapshot on demand")
+    args = parser.parse_args()
+    
+    data_manager = DataManager(args.data_file, journal=True, lazy_history=args.lazy_history)
+    if args.rebuild:
+        matched = data_manager.rebuild_rollups()
+        data_manager.checkpoint()
+        if not matched:
+            print("Maintained rollups were out of date and have been rebuilt", file=sys.stderr)
+    print_report(data_manager, args.day, args.owner, args.top)
+
+if __name__ == "__main__":
+    main()
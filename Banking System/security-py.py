@@ -1,9 +0,0 @@
-import hashlib
-
-def hash_password(password):
-    """Hash a password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(password, hashed_password):
-    """Verify a password against a hash"""
-    return hash_password(password) == hashed_password
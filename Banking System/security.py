@@ -0,0 +1,45 @@
+import hmac
+import hashlib
+import secrets
+
+# PBKDF2-HMAC-SHA256 work factor. Logins are verified once per session, so
+# a deliberately slow hash stays affordable
+PBKDF2_ITERATIONS = 600000
+
+def hash_password(password, iterations=PBKDF2_ITERATIONS):
+    """Hash a password with a random salt using PBKDF2-HMAC-SHA256"""
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+def verify_password(password, hashed_password):
+    """Verify a password against a hash, including legacy unsalted SHA-256 hashes"""
+    if hashed_password.startswith('pbkdf2_sha256$'):
+        _, iterations, salt, digest = hashed_password.split('$')
+        candidate = hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), int(iterations))
+        return hmac.compare_digest(candidate.hex(), digest)
+    return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), hashed_password)
+
+# Checked instead of a stored hash for unknown usernames, so a failed login
+# takes as long whether or not the user exists. No password produces it
+DUMMY_HASH = f"pbkdf2_sha256${PBKDF2_ITERATIONS}${'00' * 16}${'00' * 32}"
+
+def needs_rehash(hashed_password):
+    """Whether a hash is legacy unsalted SHA-256 or uses fewer iterations than PBKDF2_ITERATIONS"""
+    if not hashed_password.startswith('pbkdf2_sha256$'):
+        return True
+    return int(hashed_password.split('$')[1]) < PBKDF2_ITERATIONS
+
+def check_password(password, hashed_password):
+    """Verify a password and return (matches, new_hash)
+    
+    hashed_password is None for an unknown user; DUMMY_HASH is checked
+    instead and the result is (False, None). new_hash is a fresh hash to
+    store when the password matched a hash that needs_rehash, else None.
+    """
+    if hashed_password is None:
+        verify_password(password, DUMMY_HASH)
+        return False, None
+    if not verify_password(password, hashed_password):
+        return False, None
+    return True, hash_password(password) if needs_rehash(hashed_password) else None
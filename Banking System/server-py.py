@@ -0,0 +1,351 @@
+import os
+import re
+import json
+import base64
+import socket
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from data_manager import DataManager
+from metrics import MetricsRegistry
+from sessions import SessionStore, CredentialVerifier, VerifierBusy
+from sharding import ShardedLedger
+
+ACCOUNT_PATH = re.compile(r'^/accounts/([^/]+)$')
+TRANSACTIONS_PATH = re.compile(r'^/accounts/([^/]+)/transactions$')
+BALANCE_PATH = re.compile(r'^/accounts/([^/]+)/balance$')
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTP server that handles connections on a fixed pool of worker threads"""
+    daemon_threads = True
+    
+    def __init__(self, server_address, handler_class, data_manager, workers=64, session_ttl=900, auth_workers=2):
+        super().__init__(server_address, handler_class)
+        self.data_manager = data_manager
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bank-api')
+        # Open connections, shut down on close so workers don't wait out their idle timeout
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+        
+        # Passwords are checked on their own small pool; requests then use
+        # session tokens instead of re-sending credentials. A request waiting
+        # on a check holds an HTTP worker, so at most half of them may wait
+        # and further logins get a 503 while token requests keep being served
+        self.sessions = SessionStore(ttl=session_ttl)
+        self.verifier = CredentialVerifier(data_manager, workers=auth_workers, max_pending=max(1, workers // 2))
+    
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process_request_worker, request, client_address)
+    
+    def _process_request_worker(self, request, client_address):
+        with self._connections_lock:
+            self._connections.add(request)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self._connections_lock:
+                self._connections.discard(request)
+            self.shutdown_request(request)
+    
+    def server_close(self):
+        super().server_close()
+        with self._connections_lock:
+            for request in self._connections:
+                try:
+                    request.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.executor.shutdown(wait=True)
+        self.verifier.shutdown()
+
+class BankRequestHandler(BaseHTTPRequestHandler):
+    """JSON API over DataManager
+    
+    Requests authenticate with a session token (Bearer) obtained from
+    POST /sessions, or with HTTP Basic credentials.
+    """
+    # HTTP/1.1 keeps connections alive between requests; without Nagle's
+    # algorithm small responses aren't held back waiting for an ACK
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    # A kept-alive connection holds a pool worker, so idle ones are closed
+    # after this many seconds
+    timeout = 5
+    
+    def log_message(self, format, *args):
+        # Per-request logging to stderr would dominate at high request rates
+        pass
+    
+    @property
+    def data_manager(self):
+        return self.server.data_manager
+    
+    def _send_json(self, status, payload):
+        # Don't acknowledge a change before it is durable; with group commit
+        # concurrent requests share one write
+        if self.command == 'POST':
+            self.data_manager.flush()
+        self._send_body(status, json.dumps(payload, separators=(',', ':')).encode(), 'application/json')
+    
+    def _send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _error(self, status, message):
+        self._send_json(status, {'success': False, 'message': message})
+    
+    def _read_json(self):
+        return json.loads(self.body) if self.body else {}
+    
+    def _authenticate(self):
+        """Return (username, role) for the request's credentials, or None
+        
+        Raises VerifierBusy if too many password checks are in progress.
+        """
+        header = self.headers.get('Authorization', '')
+        if header.startswith('Bearer '):
+            return self.server.sessions.get(header[7:])
+        if not header.startswith('Basic '):
+            return None
+        try:
+            username, _, password = base64.b64decode(header[6:]).decode().partition(':')
+        except ValueError:
+            return None
+        role = self.server.verifier.verify(username, password)
+        return (username, role) if role else None
+    
+    def _account_for(self, user, account_id):
+        """Look up an account the user may access, sending an error if not"""
+        account = self.data_manager.get_account(account_id)
+        if not account:
+            self._error(404, "Account not found")
+            return None
+        username, role = user
+        if role != 'admin' and account['owner'] != username:
+            self._error(403, "You don't have permission to view this account")
+            return None
+        return account
+    
+    @staticmethod
+    def _account_summary(account_id, account):
+        return {
+            'id': account_id,
+            'owner': account['owner'],
+            'type': account['type'],
+            'balance': account['balance'],
+            'created_at': account['created_at']
+        }
+    
+    def _dispatch(self, method):
+        # Always consume the body so the kept-alive connection stays in sync
+        self.body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        
+        try:
+            user = self._authenticate()
+        except VerifierBusy:
+            self._error(503, "Too many logins in progress, try again shortly")
+            return
+        if not user:
+            self._error(401, "Invalid username or password")
+            return
+        
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        try:
+            handled = self._route(method, url.path, query, user)
+        except (ValueError, KeyError, TypeError, OverflowError) as e:
+            self._error(400, f"Bad request: {e}")
+            return
+        if not handled:
+            self._error(404, "Not found")
+    
+    def _route(self, method, path, query, user):
+        username, role = user
+        
+        if method == 'POST' and path == '/sessions':
+            token = self.server.sessions.create(username, role)
+            self._send_json(201, {'success': True, 'token': token, 'expires_in': self.server.sessions.ttl})
+            return True
+        
+        if method == 'DELETE' and path == '/sessions':
+            header = self.headers.get('Authorization', '')
+            if header.startswith('Bearer '):
+                self.server.sessions.revoke(header[7:])
+            self._send_json(200, {'success': True})
+            return True
+        
+        if method == 'GET' and path == '/metrics':
+            if role != 'admin':
+                self._error(403, "Admin access required")
+            elif self.data_manager.metrics is None:
+                self._error(404, "Metrics are disabled")
+            else:
+                self._send_body(200, self.data_manager.metrics.exposition().encode(),
+                                'text/plain; version=0.0.4')
+            return True
+        
+        if method == 'GET' and path == '/accounts':
+            owner = query.get('owner', [username])[0] if role == 'admin' else username
+            accounts = self.data_manager.get_user_accounts(owner)
+            self._send_json(200, [self._account_summary(acc_id, acc) for acc_id, acc in accounts.items()])
+            return True
+        
+        match = ACCOUNT_PATH.match(path)
+        if method == 'GET' and match:
+            account = self._account_for(user, match.group(1))
+            if account:
+                self._send_json(200, self._account_summary(match.group(1), account))
+            return True
+        
+        match = TRANSACTIONS_PATH.match(path)
+        if match:
+            account_id = match.group(1)
+            if not self._account_for(user, account_id):
+                return True
+            if method == 'GET':
+                if 'start' in query and 'end' in query:
+                    transactions = self.data_manager.transactions_between(
+                        account_id, query['start'][0], query['end'][0]
+                    )
+                else:
+                    transactions = self.data_manager.get_transactions(
+                        account_id,
+                        offset=int(query.get('offset', ['0'])[0]),
+                        limit=int(query.get('limit', ['50'])[0])
+                    )
+                self._send_json(200, [{key: t[key] for key in ('type', 'amount', 'date', 'description', 'balance')}
+                                      for t in transactions])
+                return True
+            if method == 'POST':
+                body = self._read_json()
+                success, message = self.data_manager.process_transaction(
+                    account_id, body['type'], body['amount'], body.get('description', '')
+                )
+                self._send_json(200 if success else 409, {'success': success, 'message': message})
+                return True
+        
+        match = BALANCE_PATH.match(path)
+        if method == 'GET' and match:
+            account_id = match.group(1)
+            if self._account_for(user, account_id):
+                as_of = query['as_of'][0]
+                self._send_json(200, {'id': account_id, 'as_of': as_of,
+                                      'balance': self.data_manager.balance_as_of(account_id, as_of)})
+            return True
+        
+        if method == 'POST' and path == '/transfers':
+            body = self._read_json()
+            if not self._account_for(user, body['from']):
+                return True
+            success, message = self.data_manager.transfer(
+                body['from'], body['to'], body['amount'], body.get('description', '')
+            )
+            self._send_json(200 if success else 409, {'success': success, 'message': message})
+            return True
+        
+        if method == 'POST' and path in ('/accounts', '/users', '/batch'):
+            if role != 'admin':
+                self._error(403, "Admin access required")
+                return True
+            body = self._read_json()
+            
+            if path == '/accounts':
+                account_id = self.data_manager.create_account(
+                    body['owner'], body['type'], body.get('initial_balance', 0)
+                )
+                self._send_json(201, {'success': True, 'account_id': account_id})
+            elif path == '/users':
+                success, message = self.data_manager.add_user(
+                    body['username'], body['password'], body['name'], body.get('role', 'client')
+                )
+                self._send_json(201 if success else 409, {'success': success, 'message': message})
+            else:
+                results = self.data_manager.process_batch(
+                    [(item['account_id'], item['type'], item['amount'], item.get('description', ''))
+                     for item in body['transactions']],
+                    atomic=body.get('atomic', False)
+                )
+                self._send_json(200, [{'success': success, 'message': message} for success, message in results])
+            return True
+        
+        return False
+    
+    def do_GET(self):
+        self._dispatch('GET')
+    
+    def do_POST(self):
+        self._dispatch('POST')
+    
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the banking system as a headless HTTP/JSON API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--data-file', default='data/bank_data.json')
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--no-journal', action='store_true', help="rewrite the snapshot on every change")
+    parser.add_argument('--lazy-history', action='store_true',
+                        help="keep transaction histories on disk until they are requested")
+    parser.add_argument('--idle-timeout', type=float, default=BankRequestHandler.timeout,
+                        help="seconds before an idle kept-alive connection is closed")
+    parser.add_argument('--session-ttl', type=int, default=900, help="seconds an idle session stays valid")
+    parser.add_argument('--auth-workers', type=int, default=2, help="threads that verify passwords")
+    parser.add_argument('--shards', type=int, default=0,
+                        help="partition accounts across this many worker processes")
+    parser.add_argument('--generations', type=int, default=3, help="snapshot generations to keep for recovery")
+    parser.add_argument('--storage-format', choices=('json', 'binary'),
+                        help="snapshot format (default: keep the data file's format)")
+    parser.add_argument('--compression', choices=('none', 'zlib'), help="compression of binary snapshots")
+    parser.add_argument('--metrics', action='store_true', help="collect metrics and serve them at /metrics")
+    parser.add_argument('--group-commit-ms', type=float, default=0,
+                        help="batch writes from concurrent requests for up to this long")
+    args = parser.parse_args()
+    
+    if args.shards:
+        # Each shard keeps its own file next to the data file
+        data_manager = ShardedLedger(os.path.dirname(args.data_file) or '.', args.shards,
+                                     max_commit_delay=args.group_commit_ms / 1000 or 0.002)
+    else:
+        data_manager = DataManager(
+            args.data_file,
+            journal=not args.no_journal,
+            thread_safe=True,
+            async_commit=args.group_commit_ms > 0,
+            max_commit_delay=args.group_commit_ms / 1000,
+            lazy_history=args.lazy_history,
+            metrics=MetricsRegistry() if args.metrics else None,
+            generations=args.generations,
+            storage_format=args.storage_format,
+            compression=args.compression
+        )
+        if data_manager.recovered_from:
+            print(f"{args.data_file} could not be read; recovered from {data_manager.recovered_from}")
+        if data_manager.journal_gap:
+            first, last = data_manager.journal_gap
+            print(f"Changes {first} to {last} are missing from the journal; the changes after them "
+                  f"were not replayed and were kept in {data_manager.JOURNAL_FILE}.unreplayed")
+    BankRequestHandler.timeout = args.idle_timeout
+    server = ThreadPoolHTTPServer((args.host, args.port), BankRequestHandler, data_manager, args.workers,
+                                  args.session_ttl, args.auth_workers)
+    print(f"Banking API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        data_manager.close()
+        data_manager.checkpoint()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+class SessionStore:
+    """In-memory session table with a sliding TTL and LRU eviction
+    
+    Sessions are kept in least recently used order, so expired sessions
+    collect at the front and are dropped cheaply when new ones are created.
+    """
+    
+    def __init__(self, ttl=900, max_sessions=100000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        # token -> [username, role, expires_at]
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def create(self, username, role):
+        """Start a session and return its token"""
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        with self._lock:
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if oldest[2] > now and len(self._sessions) < self.max_sessions:
+                    break
+                self._sessions.popitem(last=False)
+            self._sessions[token] = [username, role, now + self.ttl]
+        return token
+    
+    def get(self, token):
+        """Return (username, role) for a live session and extend it, or None"""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            if session[2] <= now:
+                del self._sessions[token]
+                return None
+            session[2] = now + self.ttl
+            self._sessions.move_to_end(token)
+            return session[0], session[1]
+    
+    def revoke(self, token):
+        """End a session; returns whether it existed"""
+        with self._lock:
+            return self._sessions.pop(token, None) is not None
+    
+    def __len__(self):
+        return len(self._sessions)
+
+class VerifierBusy(Exception):
+    """Too many credential checks are already queued"""
+
+class CredentialVerifier:
+    """Checks credentials on a small dedicated thread pool
+    
+    Password hashing releases the GIL, so a few workers use a bounded share
+    of the CPU however many logins arrive at once, and callers beyond
+    max_pending are turned away instead of queueing behind them.
+    """
+    
+    def __init__(self, data_manager, workers=2, max_pending=256):
+        self.data_manager = data_manager
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bank-auth')
+        self._slots = threading.BoundedSemaphore(max_pending)
+    
+    def submit(self, username, password):
+        """Queue a check; returns a Future for the user's role (None if invalid)"""
+        if not self._slots.acquire(blocking=False):
+            raise VerifierBusy()
+        future = self._executor.submit(self.data_manager.authenticate_user, username, password)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+    
+    def verify(self, username, password, timeout=None):
+        """Check credentials on the pool and wait for the role (None if invalid)"""
+        return self.submit(username, password).result(timeout)
+    
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,366 @@
+import os
+import json
+import zlib
+import datetime
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import Future
+
+from data_manager import DataManager, MAX_CENTS
+
+def _header(account):
+    return account.header() if account else None
+
+# Calls a shard process serves: name -> function(data_manager, *args). Results
+# are sent back pickled, so accounts travel as headers without their history
+SHARD_METHODS = {
+    'get_account': lambda dm, account_id: _header(dm.get_account(account_id)),
+    'get_user_accounts': lambda dm, username: {
+        acc_id: account.header() for acc_id, account in dm.get_user_accounts(username).items()},
+    'get_transaction_count': DataManager.get_transaction_count,
+    'get_transactions': DataManager.get_transactions,
+    'balance_as_of': DataManager.balance_as_of,
+    'transactions_between': DataManager.transactions_between,
+    'reconcile': DataManager.reconcile,
+    # Owners are users of the router's directory, not of the shard
+    'create_account': DataManager._create_account,
+    'process_transaction': DataManager.process_transaction,
+    'process_batch': DataManager.process_batch,
+    'transfer': DataManager.transfer,
+    'checkpoint': DataManager.checkpoint
+}
+
+# Calls that change data; they are answered only once the change is durable
+WRITE_METHODS = frozenset(('create_account', 'process_transaction', 'process_batch', 'transfer'))
+
+def _serve_shard(conn, data_file, max_commit_delay):
+    """Shard process main loop: apply calls in order, acknowledge writes after group commit"""
+    data_manager = DataManager(data_file, journal=True, async_commit=True, max_commit_delay=max_commit_delay)
+    send_lock = threading.Lock()
+    
+    def reply(request_id, success, value):
+        with send_lock:
+            conn.send((request_id, success, value))
+    
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        
+        request_id, method, args = message
+        try:
+            result = SHARD_METHODS[method](data_manager, *args)
+        except Exception as e:
+            reply(request_id, False, e)
+            continue
+        
+        if method in WRITE_METHODS:
+            # Keep serving while the writer thread persists the group
+            data_manager.flush(wait=False).add_done_callback(
+                lambda _, request_id=request_id, result=result: reply(request_id, True, result))
+        else:
+            reply(request_id, True, result)
+    
+    data_manager.close()
+    data_manager.checkpoint()
+
+class ShardClient:
+    """Connection to one shard process; many calls can be in flight at once"""
+    
+    def __init__(self, context, data_file, max_commit_delay):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve_shard, args=(child_conn, data_file, max_commit_delay),
+                                       name=f"bank-shard-{os.path.basename(data_file)}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        
+        self._ids = itertools.count()
+        self._pending = {}
+        self._send_lock = threading.Lock()
+        self._receiver = threading.Thread(target=self._receive_loop, daemon=True)
+        self._receiver.start()
+    
+    def submit(self, method, *args):
+        """Send a call and return a Future for its result"""
+        future = Future()
+        with self._send_lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            self.conn.send((request_id, method, args))
+        return future
+    
+    def call(self, method, *args):
+        return self.submit(method, *args).result()
+    
+    def _receive_loop(self):
+        while True:
+            try:
+                request_id, success, value = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            future = self._pending.pop(request_id)
+            if success:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        
+        # The shard is gone; nothing in flight will be answered
+        for request_id in list(self._pending):
+            self._pending.pop(request_id).set_exception(ConnectionError("Shard process exited"))
+    
+    def close(self):
+        with self._send_lock:
+            self.conn.send(None)
+        self.process.join()
+        self.conn.close()
+
+class ShardedLedger:
+    """DataManager-like router over accounts hash-partitioned across processes
+    
+    Each shard process owns its own journaled data file and commits with
+    group commit, so postings to different shards run on different cores.
+    Users and the account ID counter live in a directory file in the router
+    process. Owner queries fan out to every shard and merge the results.
+    Accounts are returned as headers; use get_transactions for history.
+    Transfers between shards run in two phases tracked in the directory; see
+    transfer.
+    """
+    
+    def __init__(self, data_dir='data', shards=None, max_commit_delay=0.002):
+        shards = shards or os.cpu_count()
+        os.makedirs(data_dir, exist_ok=True)
+        
+        # The partitioning depends on the shard count, so it can't change
+        layout_file = os.path.join(data_dir, 'shards.json')
+        if os.path.exists(layout_file):
+            with open(layout_file, 'r') as f:
+                existing = json.load(f)['shards']
+            if existing != shards:
+                raise ValueError(f"{data_dir} is partitioned into {existing} shards, not {shards}")
+        else:
+            with open(layout_file, 'w') as f:
+                json.dump({'shards': shards}, f)
+        
+        # Spawned rather than forked, so shards don't inherit the router's threads
+        context = multiprocessing.get_context('spawn')
+        self.shards = [ShardClient(context, os.path.join(data_dir, f'shard{index}.json'), max_commit_delay)
+                       for index in range(shards)]
+        self.directory = DataManager(os.path.join(data_dir, 'directory.json'), journal=True, thread_safe=True)
+        # Guards the pending transfers held in the directory's meta section
+        self._transfers_lock = threading.RLock()
+        self.recover_transfers()
+        
+        # Writes are durable when a shard answers, so there is nothing to flush
+        self.metrics = None
+    
+    def shard_for(self, account_id):
+        """The shard owning an account; crc32 is stable across processes and runs"""
+        return self.shards[zlib.crc32(account_id.encode()) % len(self.shards)]
+    
+    def authenticate_user(self, username, password):
+        return self.directory.authenticate_user(username, password)
+    
+    def get_user_data(self, username):
+        return self.directory.get_user_data(username)
+    
+    def get_users(self):
+        return self.directory.get_users()
+    
+    def add_user(self, username, password, name, role):
+        return self.directory.add_user(username, password, name, role)
+    
+    def create_account(self, owner, account_type, initial_balance):
+        """Allocate an ID from the directory and create the account on its shard"""
+        if self.directory.get_user_data(owner) is None:
+            raise ValueError(f"Unknown account owner: {owner}")
+        account_id = self.directory.reserve_account_ids(1)[0]
+        return self.shard_for(account_id).call('create_account', owner, account_type, initial_balance, account_id)
+    
+    def get_account(self, account_id):
+        return self.shard_for(account_id).call('get_account', account_id)
+    
+    def get_user_accounts(self, username):
+        """Fan out to every shard and merge the owner's accounts in ID order"""
+        futures = [shard.submit('get_user_accounts', username) for shard in self.shards]
+        accounts = {}
+        for future in futures:
+            accounts.update(future.result())
+        return dict(sorted(accounts.items()))
+    
+    def get_transaction_count(self, account_id):
+        return self.shard_for(account_id).call('get_transaction_count', account_id)
+    
+    def get_transactions(self, account_id, offset=0, limit=None, newest_first=True):
+        return self.shard_for(account_id).call('get_transactions', account_id, offset, limit, newest_first)
+    
+    def balance_as_of(self, account_id, when):
+        return self.shard_for(account_id).call('balance_as_of', account_id, when)
+    
+    def transactions_between(self, account_id, start, end):
+        return self.shard_for(account_id).call('transactions_between', account_id, start, end)
+    
+    def process_transaction(self, account_id, transaction_type, amount, description):
+        return self.shard_for(account_id).call(
+            'process_transaction', account_id, transaction_type, amount, description)
+    
+    def process_batch(self, transactions, atomic=False):
+        """Split a batch by shard, run the parts in parallel and merge the results in order
+        
+        Each shard commits its part with a single write. The parts commit
+        independently, so atomic batches must stay within one shard.
+        """
+        transactions = list(transactions)
+        parts = {}
+        for index, transaction in enumerate(transactions):
+            shard = self.shard_for(transaction[0])
+            parts.setdefault(shard, []).append((index, transaction))
+        if atomic and len(parts) > 1:
+            return [(False, "Atomic batches must not span shards")] * len(transactions)
+        
+        futures = [(part, shard.submit('process_batch', [transaction for _, transaction in part], atomic))
+                   for shard, part in parts.items()]
+        results = [None] * len(transactions)
+        for part, future in futures:
+            for (index, _), result in zip(part, future.result()):
+                results[index] = result
+        return results
+    
+    def transfer(self, source_id, target_id, amount, description=''):
+        """Move amount (cents) between two accounts
+        
+        Accounts on the same shard are changed in one commit. Across shards
+        the source shard commits a withdrawal and then the target shard a
+        deposit, both tagged with the same transfer ID. The transfer is
+        recorded in the directory before the withdrawal and its state
+        advanced after each leg, so recover_transfers can finish one cut
+        short by a crash. If the target refuses the deposit, the withdrawal
+        is refunded.
+        """
+        if source_id == target_id:
+            return False, "Cannot transfer to the same account"
+        
+        source_shard = self.shard_for(source_id)
+        target_shard = self.shard_for(target_id)
+        if source_shard is target_shard:
+            return source_shard.call('transfer', source_id, target_id, amount, description)
+        
+        # Checked up front so the usual refusals don't need a refund
+        target = target_shard.call('get_account', target_id)
+        if target is None:
+            return False, "Target account not found"
+        if isinstance(amount, int) and target['balance'] + amount > MAX_CENTS:
+            return False, "Resulting balance is too large"
+        
+        with self._transfers_lock:
+            number = self.directory.get_meta('next_transfer_number', 1)
+            transfer_id = f"XTF{number:06d}"
+            transfer = {'from': source_id, 'to': target_id, 'amount': amount, 'description': description,
+                        'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'state': 'started'}
+            self._set_pending_transfer(transfer_id, transfer, next_transfer_number=number + 1)
+        
+        success, message = source_shard.call('process_transaction', source_id, 'withdraw', amount,
+                                             self._leg_description(transfer_id, transfer, 'withdraw'))
+        if not success:
+            self._set_pending_transfer(transfer_id, None)
+            return False, message
+        return self._finish_transfer(transfer_id, dict(transfer, state='withdrawn'))
+    
+    @staticmethod
+    def _leg_description(transfer_id, transfer, leg):
+        suffix = f" - {transfer['description']}" if transfer['description'] else ""
+        if leg == 'withdraw':
+            return f"Transfer {transfer_id} to {transfer['to']}{suffix}"
+        if leg == 'deposit':
+            return f"Transfer {transfer_id} from {transfer['from']}{suffix}"
+        return f"Refund of transfer {transfer_id} to {transfer['to']}"
+    
+    def _set_pending_transfer(self, transfer_id, transfer, **meta):
+        """Record a pending transfer's state in the directory, or drop it when transfer is None"""
+        with self._transfers_lock:
+            pending = dict(self.directory.get_meta('pending_transfers', {}))
+            if transfer is None:
+                pending.pop(transfer_id, None)
+            else:
+                pending[transfer_id] = transfer
+            self.directory.set_meta(dict(meta, pending_transfers=pending))
+    
+    def _finish_transfer(self, transfer_id, transfer):
+        """Deposit a withdrawn transfer on the target shard, or refund the source"""
+        self._set_pending_transfer(transfer_id, transfer)
+        if transfer['state'] == 'withdrawn':
+            success, message = self.shard_for(transfer['to']).call(
+                'process_transaction', transfer['to'], 'deposit', transfer['amount'],
+                self._leg_description(transfer_id, transfer, 'deposit'))
+            if success:
+                self._set_pending_transfer(transfer_id, None)
+                return True, f"Transfer {transfer_id} completed successfully"
+            transfer = dict(transfer, state='refunding', reason=message)
+            self._set_pending_transfer(transfer_id, transfer)
+        
+        success, message = self.shard_for(transfer['from']).call(
+            'process_transaction', transfer['from'], 'deposit', transfer['amount'],
+            self._leg_description(transfer_id, transfer, 'refund'))
+        if not success:
+            # Left pending; recover_transfers retries it on the next start
+            return False, f"Transfer {transfer_id} failed and its refund is pending: {message}"
+        self._set_pending_transfer(transfer_id, None)
+        return False, f"Transfer {transfer_id} was refunded: {transfer['reason']}"
+    
+    def _has_leg(self, account_id, transfer_id, transfer, leg):
+        """Whether an account's history has a leg of a pending transfer"""
+        # Allow for the clock stepping back between recording and committing
+        since = datetime.datetime.fromisoformat(transfer['date']) - datetime.timedelta(days=1)
+        description = self._leg_description(transfer_id, transfer, leg)
+        return any(transaction.description == description for transaction in self.shard_for(account_id).call(
+            'transactions_between', account_id, since, datetime.datetime.max))
+    
+    def recover_transfers(self):
+        """Finish cross-shard transfers that a crash left pending in the directory
+        
+        Each is completed or refunded from the state of the legs found in
+        the shards' histories. Returns the (success, message) of each.
+        """
+        results = []
+        for transfer_id, transfer in sorted(self.directory.get_meta('pending_transfers', {}).items()):
+            state = transfer['state']
+            if state == 'started':
+                if not self._has_leg(transfer['from'], transfer_id, transfer, 'withdraw'):
+                    self._set_pending_transfer(transfer_id, None)
+                    results.append((False, f"Transfer {transfer_id} was not started"))
+                    continue
+                state = 'withdrawn'
+            if state == 'withdrawn' and self._has_leg(transfer['to'], transfer_id, transfer, 'deposit'):
+                self._set_pending_transfer(transfer_id, None)
+                results.append((True, f"Transfer {transfer_id} completed successfully"))
+                continue
+            if state == 'refunding' and self._has_leg(transfer['from'], transfer_id, transfer, 'refund'):
+                self._set_pending_transfer(transfer_id, None)
+                results.append((False, f"Transfer {transfer_id} was refunded: {transfer['reason']}"))
+                continue
+            results.append(self._finish_transfer(transfer_id, dict(transfer, state=state)))
+        return results
+    
+    def reconcile(self):
+        futures = [shard.submit('reconcile') for shard in self.shards]
+        return sorted(account_id for future in futures for account_id in future.result())
+    
+    def flush(self, wait=True):
+        future = Future()
+        future.set_result(None)
+        return future
+    
+    def checkpoint(self):
+        """Checkpoint the directory and every running shard"""
+        futures = [shard.submit('checkpoint') for shard in self.shards if shard.process.is_alive()]
+        for future in futures:
+            future.result()
+        self.directory.checkpoint()
+    
+    def close(self):
+        """Stop the shard processes; each checkpoints its data file on the way out"""
+        for shard in self.shards:
+            shard.close()
@@ -0,0 +1,125 @@
+import sys
+import json
+import zlib
+import struct
+from array import array
+
+# A binary snapshot is MAGIC, one compression byte and then a stream of
+# records, each a one-byte tag and a uint64 payload length. The stream after
+# the compression byte is zlib-compressed as a whole when it is set.
+# Integers are little-endian.
+MAGIC = b'BANKSNP1'
+
+COMPRESSIONS = {'none': 0, 'zlib': 1}
+
+# Record tags
+HEADER = b'H'   # JSON object with everything except the accounts
+STRINGS = b'S'  # JSON list of strings appended to the string dictionary
+ACCOUNT = b'A'  # JSON [id, owner, type, balance, created_at], then the transaction columns
+
+_RECORD = struct.Struct('<cQ')
+# Account header length and number of transactions
+_ACCOUNT_PREFIX = struct.Struct('<II')
+
+# Transaction columns of an account record, in order: transaction types and
+# descriptions are IDs into the string dictionary, amounts are cents and
+# dates are seconds since 1970-01-01
+COLUMN_TYPECODES = ('I', 'q', 'q', 'I')
+
+def is_binary_snapshot(raw):
+    return raw[:len(MAGIC)] == MAGIC
+
+def compression_of(raw):
+    """Name of the compression used by a binary snapshot"""
+    code = raw[len(MAGIC)]
+    return next(name for name, value in COMPRESSIONS.items() if value == code)
+
+def _to_little_endian(column):
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column
+
+class SnapshotWriter:
+    """Streams a snapshot to a binary file in the layout described at MAGIC
+    
+    Strings must be written before the first account record that uses them;
+    write_strings takes the whole append-only dictionary and writes only the
+    strings added since its last call.
+    """
+    
+    def __init__(self, f, compression='none'):
+        f.write(MAGIC + bytes((COMPRESSIONS[compression],)))
+        self._file = f
+        self._compressor = zlib.compressobj(6) if compression == 'zlib' else None
+        self._strings_written = 0
+    
+    def _write(self, data):
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._file.write(data)
+    
+    def _record(self, tag, *parts):
+        self._write(_RECORD.pack(tag, sum(len(part) for part in parts)))
+        for part in parts:
+            self._write(part)
+    
+    def write_header(self, header):
+        self._record(HEADER, json.dumps(header, separators=(',', ':')).encode())
+    
+    def write_strings(self, strings):
+        if len(strings) > self._strings_written:
+            self._record(STRINGS, json.dumps(strings[self._strings_written:], separators=(',', ':')).encode())
+            self._strings_written = len(strings)
+    
+    def write_account(self, account_id, owner, account_type, balance, created_at, columns):
+        """Write one account; columns are arrays in COLUMN_TYPECODES order"""
+        header = json.dumps([account_id, owner, account_type, balance, created_at], separators=(',', ':')).encode()
+        self._record(ACCOUNT, _ACCOUNT_PREFIX.pack(len(header), len(columns[1])), header,
+                     *(memoryview(_to_little_endian(column)).cast('B') for column in columns))
+    
+    def close(self):
+        """Finish the compressed stream; the file itself is left open"""
+        if self._compressor is not None:
+            self._file.write(self._compressor.flush())
+
+def read_records(raw):
+    """Yield (tag, value) for each record of a binary snapshot held in raw
+    
+    HEADER and STRINGS values are the decoded JSON. ACCOUNT values are
+    (account_id, owner, type, balance, created_at, columns) with columns as
+    arrays in COLUMN_TYPECODES order, using IDs of the snapshot's own string
+    dictionary.
+    """
+    if not is_binary_snapshot(raw):
+        raise ValueError("Not a binary snapshot")
+    body = memoryview(raw)[len(MAGIC) + 1:]
+    if compression_of(raw) == 'zlib':
+        body = memoryview(zlib.decompress(body))
+    
+    position = 0
+    while position < len(body):
+        tag, size = _RECORD.unpack_from(body, position)
+        position += _RECORD.size
+        payload = body[position:position + size]
+        position += size
+        if len(payload) != size:
+            raise ValueError("Truncated binary snapshot")
+        
+        if tag != ACCOUNT:
+            yield tag, json.loads(bytes(payload))
+            continue
+        
+        header_size, count = _ACCOUNT_PREFIX.unpack_from(payload)
+        offset = _ACCOUNT_PREFIX.size + header_size
+        account_id, owner, account_type, balance, created_at = json.loads(bytes(payload[_ACCOUNT_PREFIX.size:offset]))
+        columns = []
+        for typecode in COLUMN_TYPECODES:
+            column = array(typecode)
+            end = offset + count * column.itemsize
+            column.frombytes(payload[offset:end])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns.append(column)
+            offset = end
+        yield tag, (account_id, owner, account_type, balance, created_at, columns)
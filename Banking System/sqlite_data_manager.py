@@ -0,0 +1,449 @@
+import os
+import sqlite3
+import datetime
+import threading
+
+from data_manager import DataManager, MAX_CENTS
+from security import hash_password, check_password
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS accounts (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL REFERENCES users(username),
+    type TEXT NOT NULL,
+    balance INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account_id TEXT NOT NULL REFERENCES accounts(id),
+    type TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_accounts_owner ON accounts(owner);
+CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions(account_id, date);
+"""
+
+class SQLiteDataManager:
+    """DataManager-compatible storage engine backed by SQLite
+    
+    Balances and amounts are stored as integer cents.
+    """
+    
+    def __init__(self, db_file='data/bank_data.db'):
+        self.DB_FILE = db_file
+        os.makedirs(os.path.dirname(self.DB_FILE) or '.', exist_ok=True)
+        
+        # isolation_level=None lets us issue BEGIN/COMMIT explicitly. The
+        # connection is shared by all threads, so each transaction, and each
+        # read, holds the lock; otherwise one thread's BEGIN or ROLLBACK would
+        # land in another thread's transaction
+        self.conn = sqlite3.connect(self.DB_FILE, isolation_level=None, check_same_thread=False)
+        self._lock = threading.RLock()
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        
+        # Create default admin user if the database is new
+        if self.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0:
+            self.conn.execute(
+                "INSERT INTO users (username, password, role, name) VALUES (?, ?, ?, ?)",
+                ('admin', hash_password('admin123'), 'admin', 'System Administrator')
+            )
+        self._sync_account_counter()
+    
+    def _sync_account_counter(self):
+        """Make sure the account counter is past every existing account ID"""
+        self.conn.execute(
+            "INSERT INTO counters (name, value) "
+            "SELECT 'next_account_number', COALESCE(MAX(CAST(SUBSTR(id, 4) AS INTEGER)), 0) + 1 FROM accounts "
+            "WHERE true ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)"
+        )
+    
+    def _allocate_account_numbers(self, count):
+        """Advance the persisted counter by count and return the first number"""
+        return self.conn.execute(
+            "UPDATE counters SET value = value + ? WHERE name = 'next_account_number' RETURNING value - ?",
+            (count, count)
+        ).fetchone()[0]
+    
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self.conn.close()
+    
+    def import_json(self, json_file):
+        """Bulk-migrate an existing bank_data.json file in a single transaction
+        
+        The file is read through DataManager, so its journal is replayed,
+        split snapshots and binary files work and float amounts are converted
+        to cents. Histories are read one account at a time. The default admin
+        user is overwritten by the imported one; importing the same accounts
+        twice fails and rolls back.
+        """
+        if not os.path.exists(json_file):
+            raise FileNotFoundError(json_file)
+        source = DataManager(json_file, lazy_history=True)
+        users = source.get_users()
+        accounts = source.get_accounts()
+        
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO users (username, password, role, name) VALUES (?, ?, ?, ?)",
+                    ((username, user['password'], user['role'], user['name'])
+                     for username, user in users.items())
+                )
+                self.conn.executemany(
+                    "INSERT INTO accounts (id, owner, type, balance, created_at) VALUES (?, ?, ?, ?, ?)",
+                    ((acc_id, acc.owner, acc.type, acc.balance, acc.created_at)
+                     for acc_id, acc in accounts.items())
+                )
+                self.conn.executemany(
+                    "INSERT INTO transactions (account_id, type, amount, date, description) VALUES (?, ?, ?, ?, ?)",
+                    ((acc_id, t.type, t.amount, t.date, t.description)
+                     for acc_id, acc in accounts.items()
+                     for t in acc.read_transactions())
+                )
+                self._sync_account_counter()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return len(users), len(accounts)
+    
+    def _account_from_row(self, row, with_transactions=True):
+        """Build an account dict in the same layout as bank_data.json"""
+        account = {
+            'owner': row['owner'],
+            'type': row['type'],
+            'balance': row['balance'],
+            'created_at': row['created_at']
+        }
+        if with_transactions:
+            account['transactions'] = [
+                dict(t) for t in self.conn.execute(
+                    "SELECT type, amount, date, description FROM transactions "
+                    "WHERE account_id = ? ORDER BY date, id",
+                    (row['id'],)
+                )
+            ]
+        return account
+    
+    def authenticate_user(self, username, password):
+        """Authenticate a user and return their role if successful"""
+        if not username or not password:
+            return None
+        
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT password, role FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        # Unknown usernames are checked against a dummy hash, so the time
+        # taken doesn't tell which users exist
+        matches, new_hash = check_password(password, row['password'] if row else None)
+        if not matches:
+            return None
+        
+        # Upgrade legacy and weaker hashes while the password is at hand
+        if new_hash:
+            with self._lock:
+                self.conn.execute("UPDATE users SET password = ? WHERE username = ?", (new_hash, username))
+        return row['role']
+    
+    def get_user_data(self, username):
+        """Get user data by username"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT password, role, name FROM users WHERE username = ?", (username,)
+            ).fetchone()
+            return dict(row) if row else None
+    
+    def get_users(self):
+        """Get all users"""
+        with self._lock:
+            return {row['username']: {'password': row['password'], 'role': row['role'], 'name': row['name']}
+                    for row in self.conn.execute("SELECT * FROM users ORDER BY rowid")}
+    
+    def add_user(self, username, password, name, role):
+        """Add a new user"""
+        # Hash before taking the lock; the KDF is deliberately slow
+        password_hash = hash_password(password)
+        try:
+            with self._lock:
+                self.conn.execute(
+                    "INSERT INTO users (username, password, role, name) VALUES (?, ?, ?, ?)",
+                    (username, password_hash, role, name)
+                )
+        except sqlite3.IntegrityError:
+            return False, "Username already exists"
+        return True, f"User {username} created successfully"
+    
+    def get_accounts(self):
+        """Get all accounts (headers only; use get_account for history)"""
+        with self._lock:
+            return {row['id']: self._account_from_row(row, with_transactions=False)
+                    for row in self.conn.execute("SELECT * FROM accounts ORDER BY id")}
+    
+    def get_user_accounts(self, username):
+        """Get accounts belonging to a specific user"""
+        with self._lock:
+            return {row['id']: self._account_from_row(row, with_transactions=False)
+                    for row in self.conn.execute(
+                        "SELECT * FROM accounts WHERE owner = ? ORDER BY id", (username,))}
+    
+    def reserve_account_ids(self, count):
+        """Reserve a block of account IDs, e.g. for a bulk loader or worker"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                start = self._allocate_account_numbers(count)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [f"ACC{number:06d}" for number in range(start, start + count)]
+    
+    def create_account(self, owner, account_type, initial_balance, account_id=None):
+        """Create a new account, optionally using a pre-reserved account ID
+        
+        initial_balance is in cents.
+        """
+        if not isinstance(initial_balance, int) or not 0 <= initial_balance <= MAX_CENTS:
+            raise ValueError("Initial balance must be integer cents between 0 and 2**63 - 1")
+        
+        now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if account_id is None:
+                    account_id = f"ACC{self._allocate_account_numbers(1):06d}"
+                self.conn.execute(
+                    "INSERT INTO accounts (id, owner, type, balance, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (account_id, owner, account_type, initial_balance, now)
+                )
+                self.conn.execute(
+                    "INSERT INTO transactions (account_id, type, amount, date, description) VALUES (?, ?, ?, ?, ?)",
+                    (account_id, 'deposit', initial_balance, now, 'Initial deposit')
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return account_id
+    
+    def get_account(self, account_id):
+        """Get account by ID"""
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM accounts WHERE id = ?", (account_id,)).fetchone()
+            return self._account_from_row(row) if row else None
+    
+    def reconcile(self):
+        """Return IDs of accounts whose balance doesn't match their history"""
+        with self._lock:
+            return [row['id'] for row in self.conn.execute(
+                "SELECT a.id FROM accounts a LEFT JOIN ("
+                "    SELECT account_id, SUM(CASE WHEN type = 'deposit' THEN amount ELSE -amount END) AS total"
+                "    FROM transactions GROUP BY account_id"
+                ") t ON t.account_id = a.id "
+                "WHERE COALESCE(t.total, 0) != a.balance ORDER BY a.id"
+            )]
+    
+    def get_transaction_count(self, account_id):
+        """Get the number of transactions recorded for an account"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM transactions WHERE account_id = ?", (account_id,)
+            ).fetchone()[0]
+    
+    def get_transactions(self, account_id, offset=0, limit=None, newest_first=True):
+        """Get a page of an account's transactions
+        
+        offset and limit count from the newest transaction when newest_first
+        is set, otherwise from the oldest one.
+        """
+        order = "DESC" if newest_first else "ASC"
+        with self._lock:
+            return [
+                dict(t) for t in self.conn.execute(
+                    "SELECT type, amount, date, description FROM transactions "
+                    f"WHERE account_id = ? ORDER BY date {order}, id {order} LIMIT ? OFFSET ?",
+                    (account_id, -1 if limit is None else limit, offset)
+                )
+            ]
+    
+    def process_transaction(self, account_id, transaction_type, amount, description):
+        """Process a transaction (deposit or withdrawal); amount is in cents"""
+        if transaction_type not in ('deposit', 'withdraw'):
+            return False, "Invalid transaction type"
+        
+        if not isinstance(amount, int):
+            return False, "Amount must be given in integer cents"
+        
+        if amount <= 0:
+            return False, "Amount must be greater than zero"
+        
+        if amount > MAX_CENTS:
+            return False, "Amount is too large"
+        
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT balance FROM accounts WHERE id = ?", (account_id,)).fetchone()
+                if not row:
+                    self.conn.execute("ROLLBACK")
+                    return False, "Account not found"
+                
+                if transaction_type == 'withdraw' and amount > row['balance']:
+                    self.conn.execute("ROLLBACK")
+                    return False, "Insufficient funds"
+                
+                # INTEGER columns would silently turn a larger balance into REAL
+                if transaction_type == 'deposit' and row['balance'] + amount > MAX_CENTS:
+                    self.conn.execute("ROLLBACK")
+                    return False, "Resulting balance is too large"
+                
+                delta = amount if transaction_type == 'deposit' else -amount
+                self.conn.execute("UPDATE accounts SET balance = balance + ? WHERE id = ?", (delta, account_id))
+                self.conn.execute(
+                    "INSERT INTO transactions (account_id, type, amount, date, description) VALUES (?, ?, ?, ?, ?)",
+                    (account_id, transaction_type, amount,
+                     datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                     description if description else f"{transaction_type.capitalize()} transaction")
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return True, "Transaction completed successfully"
+    
+    def process_batch(self, transactions, atomic=False):
+        """Process many (account_id, type, amount, description) transactions
+        
+        Same semantics as DataManager.process_batch: items are validated in
+        order, accepted ones are committed in one database transaction, and
+        atomic=True applies nothing unless every item is valid.
+        """
+        now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        balances = {}
+        rows = []
+        results = []
+        
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for account_id, transaction_type, amount, description in transactions:
+                    if account_id not in balances:
+                        row = self.conn.execute("SELECT balance FROM accounts WHERE id = ?", (account_id,)).fetchone()
+                        balances[account_id] = row['balance'] if row else None
+                    
+                    if transaction_type not in ('deposit', 'withdraw'):
+                        results.append((False, "Invalid transaction type"))
+                    elif not isinstance(amount, int):
+                        results.append((False, "Amount must be given in integer cents"))
+                    elif amount <= 0:
+                        results.append((False, "Amount must be greater than zero"))
+                    elif amount > MAX_CENTS:
+                        results.append((False, "Amount is too large"))
+                    elif balances[account_id] is None:
+                        results.append((False, "Account not found"))
+                    elif transaction_type == 'withdraw' and amount > balances[account_id]:
+                        results.append((False, "Insufficient funds"))
+                    elif transaction_type == 'deposit' and balances[account_id] + amount > MAX_CENTS:
+                        results.append((False, "Resulting balance is too large"))
+                    else:
+                        balances[account_id] += amount if transaction_type == 'deposit' else -amount
+                        rows.append((account_id, transaction_type, amount, now,
+                                     description if description else f"{transaction_type.capitalize()} transaction"))
+                        results.append((True, "Transaction completed successfully"))
+                
+                if atomic and len(rows) != len(results):
+                    self.conn.execute("ROLLBACK")
+                    return [(False, "Batch rolled back") if success else (success, message)
+                            for success, message in results]
+                
+                self.conn.executemany(
+                    "INSERT INTO transactions (account_id, type, amount, date, description) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self.conn.executemany(
+                    "UPDATE accounts SET balance = ? WHERE id = ?",
+                    ((balance, account_id) for account_id, balance in balances.items() if balance is not None)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return results
+    
+    def transfer(self, source_id, target_id, amount, description=''):
+        """Move amount (cents) between two accounts in one database transaction"""
+        if source_id == target_id:
+            return False, "Cannot transfer to the same account"
+        
+        if not isinstance(amount, int):
+            return False, "Amount must be given in integer cents"
+        
+        if amount <= 0:
+            return False, "Amount must be greater than zero"
+        
+        if amount > MAX_CENTS:
+            return False, "Amount is too large"
+        
+        now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        suffix = f" - {description}" if description else ""
+        
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                source = self.conn.execute("SELECT balance FROM accounts WHERE id = ?", (source_id,)).fetchone()
+                target = self.conn.execute("SELECT balance FROM accounts WHERE id = ?", (target_id,)).fetchone()
+                error = None
+                if not source:
+                    error = "Account not found"
+                elif amount > source['balance']:
+                    error = "Insufficient funds"
+                elif not target:
+                    error = "Target account not found"
+                elif target['balance'] + amount > MAX_CENTS:
+                    error = "Resulting balance is too large"
+                if error:
+                    self.conn.execute("ROLLBACK")
+                    return False, error
+                
+                self.conn.execute(
+                    "INSERT INTO counters (name, value) VALUES ('next_transfer_number', 1) ON CONFLICT(name) DO NOTHING"
+                )
+                number = self.conn.execute(
+                    "UPDATE counters SET value = value + 1 WHERE name = 'next_transfer_number' RETURNING value - 1"
+                ).fetchone()[0]
+                transfer_id = f"TRF{number:06d}"
+                
+                self.conn.execute("UPDATE accounts SET balance = balance - ? WHERE id = ?", (amount, source_id))
+                self.conn.execute("UPDATE accounts SET balance = balance + ? WHERE id = ?", (amount, target_id))
+                self.conn.executemany(
+                    "INSERT INTO transactions (account_id, type, amount, date, description) VALUES (?, ?, ?, ?, ?)",
+                    [(source_id, 'withdraw', amount, now, f"Transfer {transfer_id} to {target_id}{suffix}"),
+                     (target_id, 'deposit', amount, now, f"Transfer {transfer_id} from {source_id}{suffix}")]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return True, f"Transfer {transfer_id} completed successfully"
@@ -0,0 +1,287 @@
+import os
+import json
+import datetime
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import data_manager
+from data_manager import DataManager
+
+class PersistenceTest(unittest.TestCase):
+    """Snapshots, generations and journal replay"""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.directory, 'bank.json')
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def open(self, **options):
+        return DataManager(self.data_file, journal=True, **options)
+    
+    def corrupt(self, path):
+        with open(path, 'r+b') as f:
+            f.truncate(50)
+    
+    def test_reopen_replays_journal(self):
+        dm = self.open()
+        dm.add_user('alice', 'secret', 'Alice', 'client')
+        account_id = dm.create_account('alice', 'checking', 1000)
+        dm.process_transaction(account_id, 'deposit', 250, 'Pay')
+        
+        reopened = self.open()
+        self.assertEqual(reopened.get_account(account_id)['balance'], 1250)
+        self.assertEqual(reopened.reconcile(), [])
+    
+    def test_appends_after_torn_journal_line_survive(self):
+        dm = self.open()
+        dm.add_user('alice', 'secret', 'Alice', 'client')
+        account_id = dm.create_account('alice', 'checking', 1000)
+        dm.process_transaction(account_id, 'deposit', 1, 'Pay')
+        with open(dm.JOURNAL_FILE, 'a') as f:
+            f.write('{"op":"transaction","acc')
+        
+        reopened = self.open()
+        self.assertEqual(reopened.get_account(account_id)['balance'], 1001)
+        for _ in range(3):
+            reopened.process_transaction(account_id, 'deposit', 100, 'Pay')
+        self.assertEqual(self.open().get_account(account_id)['balance'], 1301)
+    
+    def test_failed_append_does_not_leave_a_gap(self):
+        dm = self.open()
+        dm.add_user('alice', 'secret', 'Alice', 'client')
+        account_id = dm.create_account('alice', 'checking', 1000)
+        with mock.patch.object(dm, '_write_records', side_effect=OSError(28, 'No space left on device')):
+            with self.assertRaises(OSError):
+                dm.process_transaction(account_id, 'deposit', 50, 'Pay')
+        dm.process_transaction(account_id, 'deposit', 100, 'Pay')
+        
+        reopened = self.open()
+        self.assertIsNone(reopened.journal_gap)
+        self.assertEqual(reopened.get_account(account_id)['balance'], dm.get_account(account_id)['balance'])
+        self.assertEqual(reopened.reconcile(), [])
+    
+    def test_journal_write_does_not_block_other_accounts(self):
+        dm = self.open(thread_safe=True)
+        dm.add_user('alice', 'secret', 'Alice', 'client')
+        first = dm.create_account('alice', 'checking', 1000)
+        second = dm.create_account('alice', 'savings', 1000)
+        writing = threading.Event()
+        release = threading.Event()
+        write_records = dm._write_records
+        
+        def slow_write(records):
+            writing.set()
+            release.wait(10)
+            write_records(records)
+        
+        with mock.patch.object(dm, '_write_records', side_effect=slow_write):
+            writer = threading.Thread(target=dm.process_transaction, args=(first, 'deposit', 50, 'Pay'))
+            writer.start()
+            writing.wait(5)
+            # Applied while the first posting is still being written
+            other = threading.Thread(target=dm.process_transaction, args=(second, 'deposit', 70, 'Pay'))
+            other.start()
+            for _ in range(100):
+                if dm.get_account(second)['balance'] == 1070:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(dm.get_account(second)['balance'], 1070)
+            release.set()
+            writer.join()
+            other.join()
+        
+        reopened = self.open()
+        self.assertEqual(reopened.get_account(first)['balance'], 1050)
+        self.assertEqual(reopened.get_account(second)['balance'], 1070)
+    
+    def test_replays_journal_without_journal_mode(self):
+        dm = self.open()
+        dm.add_user('alice', 'secret', 'Alice', 'client')
+        account_id = dm.create_account('alice', 'checking', 1000)
+        
+        plain = DataManager(self.data_file)
+        self.assertEqual(plain.get_account(account_id)['balance'], 1000)
+        plain.process_transaction(account_id, 'deposit', 1, 'Pay')
+        self.assertEqual(self.open().get_account(account_id)['balance'], 1001)
+    
+    def test_keeps_generations(self):
+        dm = self.open(generations=2)
+        dm.add_user('alice', 'secret', 'Alice', 'client')
+        for _ in range(4):
+            dm.checkpoint()
+        generation = dm.get_meta('generation')
+        self.assertTrue(os.path.exists(f"{self.data_file}.{generation - 1}"))
+        self.assertFalse(os.path.exists(f"{self.data_file}.{generation - 2}"))
+    
+    def test_recovers_interrupted_snapshot_from_journal(self):
+        dm = self.open()
+        dm.add_user('alice', 'secret', 'Alice', 'client')
+        account_id = dm.create_account('alice', 'checking', 1000)
+        dm.checkpoint()
+        dm.process_transaction(account_id, 'deposit', 250, 'Pay')
+        # Crash during the next checkpoint: the previous generation was kept
+        # and a torn snapshot renamed into place before the journal was reset
+        os.link(self.data_file, f"{self.data_file}.{dm.get_meta('generation')}")
+        os.remove(self.data_file)
+        with open(self.data_file, 'w') as f:
+            f.write('{"users": {')
+        
+        with self.assertWarns(RuntimeWarning):
+            reopened = self.open()
+        self.assertIsNotNone(reopened.recovered_from)
+        self.assertIsNone(reopened.journal_gap)
+        self.assertEqual(reopened.get_account(account_id)['balance'], 1250)
+    
+    def test_torn_history_file_rolls_back(self):
+        dm = self.open(lazy_history=True)
+        dm.add_user('alice', 'secret', 'Alice', 'client')
+        account_id = dm.create_account('alice', 'checking', 1000)
+        dm.checkpoint()
+        dm.process_transaction(account_id, 'deposit', 250, 'Pay')
+        # Crash during the next checkpoint after a torn history file write,
+        # before the journal was reset
+        shutil.copyfile(dm.JOURNAL_FILE, self.data_file + '.saved')
+        dm.checkpoint()
+        shutil.copyfile(self.data_file + '.saved', dm.JOURNAL_FILE)
+        with open(os.path.join(self.directory, dm.get_meta('history_file')), 'r+b') as f:
+            f.truncate(10)
+        
+        with self.assertWarns(RuntimeWarning):
+            reopened = self.open(lazy_history=True)
+        self.assertIsNotNone(reopened.recovered_from)
+        self.assertIsNone(reopened.journal_gap)
+        self.assertEqual(reopened.get_account(account_id)['balance'], 1250)
+        self.assertEqual(reopened.reconcile(), [])
+    
+    def test_keeps_externally_saved_file(self):
+        dm = self.open()
+        dm.add_user('alice', 'secret', 'Alice', 'client')
+        account_id = dm.create_account('alice', 'checking', 1000)
+        dm.checkpoint()
+        dm.process_transaction(account_id, 'deposit', 250, 'Pay')
+        # Saved by BankSystem.py, which doesn't record generations
+        with open(self.data_file) as f:
+            data = json.load(f)
+        data['users']['alice']['name'] = 'Alice Smith'
+        with open(self.data_file, 'w') as f:
+            json.dump(data, f)
+        
+        reopened = self.open()
+        self.assertIsNone(reopened.recovered_from)
+        self.assertEqual(reopened.get_user_data('alice')['name'], 'Alice Smith')
+        self.assertEqual(reopened.get_account(account_id)['balance'], 1250)
+        reopened.checkpoint()
+        self.assertEqual(self.open().get_user_data('alice')['name'], 'Alice Smith')
+    
+    def test_journal_gap_is_not_replayed(self):
+        dm = self.open()
+        dm.add_user('alice', 'secret', 'Alice', 'client')
+        first_id = dm.create_account('alice', 'checking', 1000)
+        dm.checkpoint()
+        second_id = dm.create_account('alice', 'savings', 500)
+        dm.checkpoint()
+        dm.process_transaction(second_id, 'deposit', 100, 'Pay')
+        dm.process_transaction(first_id, 'withdraw', 100, 'Rent')
+        self.corrupt(self.data_file)
+        
+        with self.assertWarns(RuntimeWarning):
+            reopened = self.open()
+        self.assertIsNotNone(reopened.recovered_from)
+        self.assertIsNotNone(reopened.journal_gap)
+        self.assertIsNone(reopened.get_account(second_id))
+        self.assertEqual(reopened.get_account(first_id)['balance'], 1000)
+        self.assertEqual(reopened.reconcile(), [])
+        self.assertTrue(os.path.exists(dm.JOURNAL_FILE + '.unreplayed'))
+    
+    def test_journal_gap_keeps_records_before_it(self):
+        dm = self.open()
+        dm.add_user('alice', 'secret', 'Alice', 'client')
+        account_id = dm.create_account('alice', 'checking', 1000)
+        dm.checkpoint()
+        for amount in (100, 200, 400):
+            dm.process_transaction(account_id, 'deposit', amount, 'Pay')
+        with open(dm.JOURNAL_FILE) as f:
+            lines = f.readlines()
+        with open(dm.JOURNAL_FILE, 'w') as f:
+            f.writelines(lines[:2] + lines[3:])
+        
+        reopened = self.open()
+        self.assertEqual(reopened.journal_gap, (reopened.get_meta('journal_seq') + 1,) * 2)
+        self.assertEqual(reopened.get_account(account_id)['balance'], 1100)
+        reopened.process_transaction(account_id, 'deposit', 5, 'Pay')
+        
+        again = self.open()
+        self.assertIsNone(again.journal_gap)
+        self.assertEqual(again.get_account(account_id)['balance'], 1105)
+    
+    def test_upgrades_legacy_password_hash(self):
+        dm = self.open()
+        dm.bulk_create({'bob': {'password': hashlib.sha256(b'secret').hexdigest(), 'role': 'client', 'name': 'Bob'}},
+                       [])
+        self.assertIsNone(dm.authenticate_user('nobody', 'secret'))
+        self.assertEqual(dm.authenticate_user('bob', 'secret'), 'client')
+        
+        reopened = self.open()
+        self.assertTrue(reopened.get_user_data('bob')['password'].startswith('pbkdf2_sha256$'))
+        self.assertEqual(reopened.authenticate_user('bob', 'secret'), 'client')
+    
+    def test_binary_format_round_trip(self):
+        dm = self.open()
+        dm.add_user('alice', 'secret', 'Alice', 'client')
+        account_id = dm.create_account('alice', 'checking', 1000)
+        dm.process_transaction(account_id, 'withdraw', 300, 'Rent')
+        expected = [transaction.to_dict() for transaction in dm.get_account(account_id).transactions]
+        
+        for compression in ('none', 'zlib'):
+            converted = self.open(storage_format='binary', compression=compression)
+            converted.checkpoint()
+            reopened = self.open()
+            self.assertEqual(reopened.storage_format, 'binary')
+            self.assertEqual(reopened.get_account(account_id)['balance'], 700)
+            self.assertEqual([transaction.to_dict() for transaction in reopened.get_account(account_id).transactions],
+                             expected)
+
+class SteppedClock(datetime.datetime):
+    """datetime whose now() returns the queued times, to step the clock back"""
+    times = []
+    
+    @classmethod
+    def now(cls, tz=None):
+        return cls.times.pop(0) if cls.times else super().now(tz)
+
+class HistoryOrderTest(unittest.TestCase):
+    """Histories stay sorted by date, which point-in-time queries rely on"""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.dm = DataManager(os.path.join(self.directory, 'bank.json'))
+        self.dm.add_user('alice', 'secret', 'Alice', 'client')
+        self.account_id = self.dm.create_account('alice', 'checking', 1000)
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def test_clock_going_back_keeps_dates_in_order(self):
+        # The end of daylight saving time repeats an hour of local time
+        SteppedClock.times = [datetime.datetime(2099, 10, 26, 2, 30), datetime.datetime(2099, 10, 26, 2, 5),
+                              datetime.datetime(2099, 10, 26, 2, 10)]
+        with mock.patch.object(data_manager.datetime, 'datetime', SteppedClock):
+            self.dm.process_transaction(self.account_id, 'deposit', 100, 'Pay')
+            self.dm.process_transaction(self.account_id, 'withdraw', 50, 'Rent')
+            self.dm.process_batch([(self.account_id, 'deposit', 5, 'Pay')])
+        
+        dates = [transaction.date for transaction in self.dm.get_transactions(self.account_id, newest_first=False)]
+        self.assertEqual(dates, sorted(dates))
+        self.assertEqual(self.dm.balance_as_of(self.account_id, '2099-10-26 02:30:00'), 1055)
+        self.assertEqual(len(self.dm.transactions_between(self.account_id, '2099-10-26 02:30:00',
+                                                          '2099-10-26 02:31:00')), 3)
+
+if __name__ == '__main__':
+    unittest.main()